@@ -0,0 +1,220 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+import numpy as np
+
+from referee.game.player import PlayerColor
+from referee.game.board import CELL_STATES
+from referee.game.constants import *
+
+from .board import Board
+from .moves import NUM_DIRECTIONS, SPAWN_MOVES, NUM_MOVES
+from .tables import CELLS, NUM_CELLS, SPREAD_RAY_INDICES, \
+    ZOBRIST_TURN, PACKED_POWER_BITS, PACKED_POWER_MASK
+
+# This module needs NumPy, so unlike the rest of the agent it is only imported
+# where batches of games are played out (rollouts, self-play, benchmarks).
+
+# Sentinel move id for boards that do not move (e.g. finished games).
+NO_MOVE = -1
+
+# Sentinel winner for boards that have not been won (still running or drawn).
+NO_WINNER = -1
+
+# SPREAD_TARGETS[m] holds the cell indices reached, in order, by spreading a
+# maximum power stack with spread move m, wrapping around the torus. A stack
+# of power p reaches the first p of them (see SPREAD_REACH).
+SPREAD_TARGETS: np.ndarray = np.array([
+    SPREAD_RAY_INDICES[cell][direction][MAX_CELL_POWER]
+    for cell in range(NUM_CELLS) for direction in range(NUM_DIRECTIONS)
+], dtype=np.intp)
+
+# SPREAD_REACH[p][k] is True iff a stack of power p reaches SPREAD_TARGETS[m][k].
+SPREAD_REACH: np.ndarray = \
+    np.arange(MAX_CELL_POWER)[None, :] < np.arange(MAX_CELL_POWER + 1)[:, None]
+
+# Sign of the cells owned by each colour, indexed by PlayerColor value.
+COLOR_SIGN: np.ndarray = np.array([1, -1], dtype=np.int8)
+
+
+# The BatchBoard class holds many independent games and advances them all at
+# once with vectorised NumPy operations. The cells of every game are stored in
+# a single `(N, NUM_CELLS)` int8 array, where each cell holds the power of its
+# stack, positive for RED and negative for BLUE (0 for empty cells), and each
+# game keeps its own turn count. As in `Board`, RED moves on even turns.
+#
+# Moves are given as integer ids (see moves.py), one per game, and must be
+# legal: like `Board.apply_trusted`, nothing is validated. There is no undo;
+# copy the batch instead.
+
+class BatchBoard:
+    __slots__ = [
+        "cells",
+        "turn_counts",
+    ]
+
+    def __init__(self, num_boards: int):
+        self.cells: np.ndarray = np.zeros((num_boards, NUM_CELLS), np.int8)
+        self.turn_counts: np.ndarray = np.zeros(num_boards, np.int16)
+
+    @classmethod
+    def from_boards(cls, boards: list) -> 'BatchBoard':
+        """
+        Build a batch from the current positions of a list of boards.
+        """
+        batch = cls(len(boards))
+        for i, b in enumerate(boards):
+            for idx, packed in b._occupied_cells():
+                batch.cells[i, idx] = COLOR_SIGN[packed >> PACKED_POWER_BITS] \
+                    * (packed & PACKED_POWER_MASK)
+            batch.turn_counts[i] = b.turn_count
+        return batch
+
+    def board(self, i: int) -> Board:
+        """
+        Return the position of the i-th game as a `Board`, with no undo
+        history (as for `Board.snapshot`).
+        """
+        b = Board({
+            CELLS[idx]: CELL_STATES[int(power < 0)][abs(int(power))]
+            for idx, power in enumerate(self.cells[i]) if power != 0
+        })
+        b._turn_count = int(self.turn_counts[i])
+        if b._turn_count % 2:
+            b._turn_color = PlayerColor.BLUE
+            b._hash ^= ZOBRIST_TURN
+        return b
+
+    def copy(self) -> 'BatchBoard':
+        """
+        Return an independent copy of the batch.
+        """
+        batch = BatchBoard.__new__(BatchBoard)
+        batch.cells = self.cells.copy()
+        batch.turn_counts = self.turn_counts.copy()
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.turn_counts)
+
+    @property
+    def turn_colors(self) -> np.ndarray:
+        """
+        The PlayerColor value of the player to move in each game.
+        """
+        return self.turn_counts & 1
+
+    @property
+    def color_powers(self) -> np.ndarray:
+        """
+        An `(N, 2)` array of the total power of each colour in each game,
+        indexed by PlayerColor value.
+        """
+        powers = self.cells.astype(np.int16)
+        return np.stack([
+            np.maximum(powers, 0).sum(axis=1),
+            np.maximum(-powers, 0).sum(axis=1),
+        ], axis=1)
+
+    @property
+    def game_over(self) -> np.ndarray:
+        """
+        True for each game that is over.
+        """
+        return self._game_over(self.color_powers)
+
+    @property
+    def winner_color(self) -> np.ndarray:
+        """
+        The PlayerColor value of the winner of each game, or NO_WINNER for
+        games that are still running or ended in a draw.
+        """
+        powers = self.color_powers
+        diff = powers[:, 0] - powers[:, 1]
+        return np.where(
+            self._game_over(powers) & (np.abs(diff) >= WIN_POWER_DIFF),
+            (diff < 0).astype(np.int8),
+            np.int8(NO_WINNER),
+        )
+
+    def _game_over(self, powers: np.ndarray) -> np.ndarray:
+        return (self.turn_counts >= 2) & (
+            (self.turn_counts >= MAX_TURNS)
+            | (powers[:, 0] == 0)
+            | (powers[:, 1] == 0)
+        )
+
+    def apply(self, moves: np.ndarray):
+        """
+        Apply one move to each game, where `moves[i]` is the id of a legal
+        move for game i, or NO_MOVE to leave game i (and its turn) unchanged.
+        """
+        moves = np.asarray(moves)
+        cells = self.cells
+        sign = COLOR_SIGN[self.turn_colors]
+
+        # Spawn a power 1 stack on the target cell.
+        spawns = np.flatnonzero(moves >= SPAWN_MOVES)
+        cells[spawns, moves[spawns] - SPAWN_MOVES] = sign[spawns]
+
+        # Remove the source stack, then add one power to each cell it
+        # reaches. A ray never revisits a cell (its length is less than
+        # BOARD_N) so the scatter has no repeated indices within a game. A
+        # stack pushed past the maximum cell power is removed from the board.
+        spreads = np.flatnonzero((moves >= 0) & (moves < SPAWN_MOVES))
+        spread_moves = moves[spreads]
+        sources = spread_moves // NUM_DIRECTIONS
+        reach = SPREAD_REACH[np.abs(cells[spreads, sources])]
+        cells[spreads, sources] = 0
+
+        rows = np.broadcast_to(spreads[:, None], reach.shape)[reach]
+        targets = SPREAD_TARGETS[spread_moves][reach]
+        powers = np.abs(cells[rows, targets]) + 1
+        powers[powers > MAX_CELL_POWER] = 0
+        cells[rows, targets] = powers * sign[rows]
+
+        self.turn_counts[moves != NO_MOVE] += 1
+
+    def legal_moves(self) -> np.ndarray:
+        """
+        Return an `(N, NUM_MOVES)` boolean mask of the legal moves in each
+        game, indexed by move id. Finished games have no legal moves.
+        """
+        owned = self.cells * COLOR_SIGN[self.turn_colors][:, None] > 0
+        powers = self.color_powers.sum(axis=1)
+        can_spawn = (self.cells == 0) & (powers < MAX_TOTAL_POWER)[:, None]
+
+        mask = np.empty((len(self), NUM_MOVES), dtype=bool)
+        mask[:, :SPAWN_MOVES] = np.repeat(owned, NUM_DIRECTIONS, axis=1)
+        mask[:, SPAWN_MOVES:] = can_spawn
+        mask[self._game_over(self.color_powers)] = False
+        return mask
+
+
+def sample_moves(mask: np.ndarray, rng: np.random.Generator,
+                 weights: np.ndarray=None) -> np.ndarray:
+    """
+    Sample one move id per row of a legal move mask, uniformly or in
+    proportion to `weights` (an array broadcastable to the mask, e.g. a
+    policy over all move ids). Rows with no legal (or no positively
+    weighted) moves get NO_MOVE.
+    """
+    probs = mask if weights is None else mask * weights
+    totals = np.cumsum(probs, axis=1, dtype=np.float64)
+    cutoffs = rng.random(len(mask)) * totals[:, -1]
+    moves = (totals <= cutoffs[:, None]).sum(axis=1)
+    return np.where(totals[:, -1] > 0, moves, NO_MOVE)
+
+
+def random_playouts(batch: BatchBoard, rng: np.random.Generator,
+                    weights: np.ndarray=None) -> np.ndarray:
+    """
+    Play every game in the batch to the end with moves sampled from the
+    legal move mask (see `sample_moves`), mutating the batch. Returns the
+    winners (see `BatchBoard.winner_color`).
+    """
+    while True:
+        moves = sample_moves(batch.legal_moves(), rng, weights)
+        if (moves == NO_MOVE).all():
+            return batch.winner_color
+        batch.apply(moves)
@@ -0,0 +1,398 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+from array import array
+
+from referee.game.hex import HexPos
+from referee.game.player import PlayerColor
+from referee.game.actions import Action, SpawnAction, SpreadAction
+from referee.game.board import CellState, CELL_STATES
+from referee.game.constants import *
+from referee.game.exceptions import IllegalActionException
+
+from . import constants
+from .board import Board
+from .moves import ACTIONS, NUM_DIRECTIONS, SPAWN_MOVES, move_id
+from .tables import ALL_CELLS_MASK, SPREAD_RAY_INDICES, \
+    ZOBRIST_CELLS, ZOBRIST_TURN, \
+    PACKED_POWER_BITS, PACKED_POWER_MASK, JOURNAL_SIZE
+
+# The BitBoard class is a drop-in alternative to `Board` for use inside the
+# search. Cells are addressed by their index `r * BOARD_N + q`, and the state
+# of the board is kept in two integers used as 49-bit masks, next to a flat
+# list of cell powers:
+#
+#   - `_masks[c]` has bit i set iff cell i is occupied by colour c.
+#   - `_powers[i]` is the power of cell i (0 if it is empty).
+#   - `_color_powers[c]` is the total power of colour c.
+#
+# The masks make finding cells by colour cheap, and the power list makes
+# reading a single cell one index lookup.
+#
+# The public API (`apply_action`, `undo_action`, `game_over`, `winner_color`,
+# indexing by `HexPos`, ...) mirrors `Board`, so the two can be swapped freely.
+#
+# Actions are undone through a journal, as in `Board(journal=True)`: a
+# preallocated array of (cell index, previous packed state) pairs with the
+# number of pairs pushed after each action.
+
+class BitBoard:
+    __slots__ = [
+        "_masks",
+        "_powers",
+        "_color_powers",
+        "_turn_color",
+        "_turn_count",
+        "_journal",
+        "_journal_top",
+        "_hash",
+    ]
+
+    def __init__(self, initial_state: dict[HexPos, CellState]={}):
+        self._masks: list[int] = [0, 0]
+        self._powers: list[int] = [0] * (BOARD_N * BOARD_N)
+        self._color_powers: list[int] = [0, 0]
+        self._turn_color: PlayerColor = PlayerColor.RED
+        self._turn_count: int = 0
+        self._journal: array = array("B", bytes(JOURNAL_SIZE))
+        self._journal_top: int = 0
+        self._hash: int = 0
+
+        for cell, state in initial_state.items():
+            if state.player is not None:
+                self._set_cell(
+                    cell.r * BOARD_N + cell.q, state.player.value, state.power)
+
+    def copy(self) -> 'BitBoard':
+        """
+        Return an independent copy of the board, including its undo journal
+        (see `Board.copy`).
+        """
+        b = self.snapshot()
+        b._journal[:self._journal_top] = self._journal[:self._journal_top]
+        b._journal_top = self._journal_top
+        return b
+
+    def snapshot(self) -> 'BitBoard':
+        """
+        Return an independent copy of the current position with an empty undo
+        journal (see `Board.snapshot`).
+        """
+        b = BitBoard.__new__(BitBoard)
+        b._masks = self._masks.copy()
+        b._powers = self._powers.copy()
+        b._color_powers = self._color_powers.copy()
+        b._turn_color = self._turn_color
+        b._turn_count = self._turn_count
+        b._journal = array("B", bytes(JOURNAL_SIZE))
+        b._journal_top = 0
+        b._hash = self._hash
+        return b
+
+    def get_hash(self) -> int:
+        """
+        Return the Zobrist key of the current position (including the player
+        to move), maintained incrementally by `apply_action`/`undo_action`.
+        """
+        return self._hash
+
+    def successor_hash(self, move: int) -> int:
+        """
+        Return the Zobrist key of the position after a legal move, without
+        applying it.
+        """
+        color = self._turn_color.value
+        key = self._hash ^ ZOBRIST_TURN
+        if move >= SPAWN_MOVES:
+            return key ^ ZOBRIST_CELLS[move - SPAWN_MOVES][color][1]
+
+        from_idx, direction = divmod(move, NUM_DIRECTIONS)
+        from_power = self._powers[from_idx]
+        key ^= ZOBRIST_CELLS[from_idx][color][from_power]
+        for to_idx in SPREAD_RAY_INDICES[from_idx][direction][from_power]:
+            to_color, to_power = self._get_cell(to_idx)
+            key ^= ZOBRIST_CELLS[to_idx][to_color][to_power]
+            if to_power < MAX_CELL_POWER:
+                key ^= ZOBRIST_CELLS[to_idx][color][to_power + 1]
+        return key
+
+    def __getitem__(self, cell: HexPos) -> CellState:
+        """
+        Return the state of a cell on the board.
+        """
+        if not self._within_bounds(cell):
+            raise IndexError(f"Cell position '{cell}' is invalid.")
+        color, power = self._get_cell(cell.r * BOARD_N + cell.q)
+        return CELL_STATES[color][power]
+
+    def apply_action(self, action: Action):
+        """
+        Apply an action to a board, mutating the board state. Returns False
+        if the action is invalid.
+        """
+        if not self.validate_action(action):
+            return False
+        self._apply(move_id(action))
+
+    def apply_trusted(self, action: Action):
+        """
+        Apply an action that is known to be legal (e.g. one produced by our
+        own move generators), skipping validation.
+        """
+        self.apply_move(move_id(action))
+
+    def apply_move(self, move: int):
+        """
+        Apply a legal move given by its id (see moves.py), skipping
+        validation as for `apply_trusted`.
+        """
+        if constants.DEBUG_TRUSTED_ACTIONS \
+                and not self.validate_action(ACTIONS[move]):
+            raise IllegalActionException(
+                f"Trusted action {ACTIONS[move]} failed validation",
+                self._turn_color)
+        self._apply(move)
+
+    def _apply(self, move: int):
+        """
+        Apply a validated move, pushing its journal frame.
+        """
+        if move >= SPAWN_MOVES:
+            self._resolve_spawn(move - SPAWN_MOVES)
+        else:
+            self._resolve_spread(*divmod(move, NUM_DIRECTIONS))
+
+        self._turn_count += 1
+        self._turn_color = self._turn_color.opponent
+        self._hash ^= ZOBRIST_TURN
+
+    def pass_turn(self):
+        """
+        Pass the turn to the opponent without changing any cells (see
+        `Board.pass_turn`), pushing an empty journal frame.
+        """
+        self._journal[self._journal_top] = 0
+        self._journal_top += 1
+        self._turn_count += 1
+        self._turn_color = self._turn_color.opponent
+        self._hash ^= ZOBRIST_TURN
+
+    def validate_action(self, action: Action) -> bool:
+        """
+        Check whether an action can be legally applied to the board.
+        """
+        match action:
+            case SpawnAction():
+                return self._validate_spawn_action(action)
+            case SpreadAction():
+                return self._validate_spread_action(action)
+            case _:
+                return False
+
+    def undo_action(self):
+        """
+        Undo the last action played, mutating the board state. Throws an
+        IndexError if no actions have been played.
+        """
+        if self._journal_top == 0:
+            raise IndexError("No actions to undo.")
+
+        journal, top = self._journal, self._journal_top - 1
+        for _ in range(journal[top]):
+            top -= 2
+            packed = journal[top + 1]
+            self._set_cell(journal[top],
+                packed >> PACKED_POWER_BITS, packed & PACKED_POWER_MASK)
+        self._journal_top = top
+        self._turn_count -= 1
+        self._turn_color = self._turn_color.opponent
+        self._hash ^= ZOBRIST_TURN
+
+    def render(self, use_color: bool=False, use_unicode: bool=False) -> str:
+        """
+        Return a visualisation of the game board via a multiline string (see
+        `Board.render`).
+        """
+        state = {}
+        for idx in range(BOARD_N * BOARD_N):
+            color, power = self._get_cell(idx)
+            if power > 0:
+                state[HexPos.at(*divmod(idx, BOARD_N))] = \
+                    CELL_STATES[color][power]
+        return Board(state).render(use_color, use_unicode)
+
+    @property
+    def turn_count(self) -> int:
+        """
+        The number of actions that have been played so far.
+        """
+        return self._turn_count
+
+    @property
+    def turn_color(self) -> PlayerColor:
+        """
+        The player (color) whose turn it is.
+        """
+        return self._turn_color
+
+    @property
+    def game_over(self) -> bool:
+        """
+        True iff the game is over.
+        """
+        if self.turn_count < 2:
+            return False
+
+        return self.turn_count >= MAX_TURNS \
+            or self._masks[0] == 0 \
+            or self._masks[1] == 0
+
+    @property
+    def winner_color(self) -> PlayerColor | None:
+        """
+        The player (color) who won the game, or None if no player has won.
+        """
+        if not self.game_over:
+            return None
+
+        red_power = self._color_power(PlayerColor.RED)
+        blue_power = self._color_power(PlayerColor.BLUE)
+
+        if abs(red_power - blue_power) < WIN_POWER_DIFF:
+            return None
+
+        return (PlayerColor.RED, PlayerColor.BLUE)[red_power < blue_power]
+
+    @property
+    def _total_power(self) -> int:
+        """
+        The total power of all cells on the board.
+        """
+        return self._color_powers[0] + self._color_powers[1]
+
+    def _color_power(self, color: PlayerColor) -> int:
+        return self._color_powers[color.value]
+
+    def _color_cell_count(self, color: PlayerColor) -> int:
+        return self._masks[color.value].bit_count()
+
+    def _cell_power(self, idx: int) -> int:
+        """
+        The power of the stack at a cell index (0 if the cell is empty).
+        """
+        return self._powers[idx]
+
+    def _color_mask(self, color: PlayerColor) -> int:
+        """
+        Bitmask of the indices of the cells occupied by `color`.
+        """
+        return self._masks[color.value]
+
+    def _empty_mask(self) -> int:
+        """
+        Bitmask of the indices of the empty cells.
+        """
+        return ALL_CELLS_MASK ^ (self._masks[0] | self._masks[1])
+
+    def _occupied_cells(self) -> list[tuple[int, int]]:
+        """
+        Return a (cell index, packed state) pair for every occupied cell.
+        """
+        occupied = self._masks[0] | self._masks[1]
+        return [
+            (idx, color << PACKED_POWER_BITS | power)
+            for idx in range(BOARD_N * BOARD_N) if occupied >> idx & 1
+            for color, power in (self._get_cell(idx),)
+        ]
+
+    def _within_bounds(self, coord: HexPos) -> bool:
+        return 0 <= coord.r < BOARD_N and 0 <= coord.q < BOARD_N
+
+    def _cell_occupied(self, coord: HexPos) -> bool:
+        bit = 1 << (coord.r * BOARD_N + coord.q)
+        return bool((self._masks[0] | self._masks[1]) & bit)
+
+    def _get_cell(self, idx: int) -> tuple[int, int]:
+        """
+        Return the (colour value, power) pair stored at a cell index. The
+        colour is meaningless when the power is zero.
+        """
+        return int(not self._masks[0] >> idx & 1), self._powers[idx]
+
+    def _set_cell(self, idx: int, color: int, power: int) -> int:
+        """
+        Overwrite the (colour value, power) of a cell, keeping the Zobrist key
+        up to date. Returns the previous packed state of the cell.
+        """
+        prev_color, prev_power = self._get_cell(idx)
+        self._hash ^= ZOBRIST_CELLS[idx][prev_color][prev_power] \
+            ^ ZOBRIST_CELLS[idx][color][power]
+
+        bit = 1 << idx
+        masks = self._masks
+        if prev_power > 0:
+            masks[prev_color] ^= bit
+            self._color_powers[prev_color] -= prev_power
+        if power > 0:
+            masks[color] |= bit
+            self._color_powers[color] += power
+        self._powers[idx] = power
+
+        if prev_power == 0:
+            return 0
+        return prev_color << PACKED_POWER_BITS | prev_power
+
+    def _journal_cell(self, idx: int, color: int, power: int):
+        """
+        Overwrite a cell, pushing its previous state onto the journal.
+        """
+        top = self._journal_top
+        self._journal[top] = idx
+        self._journal[top + 1] = self._set_cell(idx, color, power)
+        self._journal_top = top + 2
+
+    def _journal_frame(self, num_cells: int):
+        """
+        Close the journal frame of an action that changed `num_cells` cells.
+        """
+        self._journal[self._journal_top] = num_cells
+        self._journal_top += 1
+
+    def _validate_spawn_action(self, action: SpawnAction) -> bool:
+        if type(action) != SpawnAction:
+            return False
+
+        cell = action.cell
+        if type(cell) != HexPos or not self._within_bounds(cell):
+            return False
+        if self._total_power >= MAX_TOTAL_POWER or self._cell_occupied(cell):
+            return False
+
+        return True
+
+    def _resolve_spawn(self, idx: int):
+        self._journal_cell(idx, self._turn_color.value, 1)
+        self._journal_frame(1)
+
+    def _validate_spread_action(self, action: SpreadAction) -> bool:
+        if type(action) != SpreadAction:
+            return False
+
+        idx = action.cell.r * BOARD_N + action.cell.q
+        return bool(self._masks[self._turn_color.value] >> idx & 1)
+
+    def _resolve_spread(self, from_idx: int, direction: int):
+        color = self._turn_color.value
+
+        # Remove token stack from source cell.
+        from_power = self._powers[from_idx]
+        self._journal_cell(from_idx, 0, 0)
+
+        # Add token stack to destination cells. A stack pushed past the
+        # maximum cell power is removed from the board.
+        to_cells = SPREAD_RAY_INDICES[from_idx][direction][from_power]
+        for to_idx in to_cells:
+            to_power = self._powers[to_idx] + 1
+            self._journal_cell(to_idx, color,
+                               to_power if to_power <= MAX_CELL_POWER else 0)
+        self._journal_frame(1 + len(to_cells))
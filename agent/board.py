@@ -1,34 +1,26 @@
 # COMP30024 Artificial Intelligence, Semester 1 2023
 # Project Part B: Game Playing Agent
 
+from array import array
 from collections import defaultdict
 from dataclasses import dataclass
 
 from referee.game.hex import HexPos, HexDir
 from referee.game.player import PlayerColor
 from referee.game.actions import Action, SpawnAction, SpreadAction
+from referee.game.board import CellState, EMPTY_CELL, CELL_STATES
 from referee.game.constants import *
+from referee.game.exceptions import IllegalActionException
 
-# The CellState class is used to represent the state of a single cell on the
-# game board.
-
-@dataclass(frozen=True, slots=True)
-class CellState:
-    player: PlayerColor|None = None
-    power: int = 0
-
-    def __post_init__(self):
-        if self.player is None or self.power > MAX_CELL_POWER:
-            object.__setattr__(self, "power", 0)
-            object.__setattr__(self, "player", None)
-
-    def __str__(self):
-        return f"CellState({self.player}, {self.power})"
-    
-    def __iter__(self):
-        yield self.player
-        yield self.power
+from . import constants
+from .moves import ACTIONS, NUM_DIRECTIONS, SPAWN_MOVES, move_id
+from .tables import CELLS, ALL_CELLS_MASK, SPREAD_RAYS, SPREAD_RAY_INDICES, \
+    DIRECTION_INDEX, \
+    ZOBRIST_CELLS, ZOBRIST_TURN, \
+    PACKED_POWER_BITS, PACKED_CELL_STATES, JOURNAL_SIZE
 
+# Cell states are the referee's CellState class, so that the shared instances
+# in CELL_STATES can be used and states compare equal across both boards.
 
 @dataclass(frozen=True, slots=True)
 class CellMutation:
@@ -52,33 +44,114 @@ class BoardMutation:
         return f"BoardMutation({self.cell_mutations})"
 
 
+def _empty_cell() -> CellState:
+    # Default factory for board state. Defined at module level (rather than a
+    # lambda) so that boards can be pickled and sent to worker processes.
+    return EMPTY_CELL
+
+
 # The Board class encapsulates the state of the game board, and provides
 # methods for applying actions to the board and querying/inspecting the state
 # of the game (i.e. which player has won, if any).
+#
+# In journal mode (`Board(journal=True)`) actions are not recorded as
+# BoardMutation objects. Instead, each changed cell is pushed onto a
+# preallocated array as a (cell index, previous packed state) pair, followed by
+# the number of pairs for the action, and undoing pops them back off.
 class Board:
     __slots__ = [
         "_mutable", 
         "_state", 
         "_turn_color", 
         "_history",
+        "_color_powers",
+        "_color_cells",
+        "_color_masks",
+        "_hash",
+        "_turn_count",
+        "_journal",
+        "_journal_top",
     ]
 
-    def __init__(self, initial_state: dict[HexPos, CellState]={}):
-        self._state: dict[HexPos, CellState] = \
-            defaultdict(lambda: CellState(None, 0))
-        self._state.update(initial_state)
+    def __init__(self, initial_state: dict[HexPos, CellState]={},
+                 journal: bool=False):
+        self._state: dict[HexPos, CellState] = defaultdict(_empty_cell)
         self._turn_color: PlayerColor = PlayerColor.RED
+        self._turn_count: int = 0
         self._history: list[BoardMutation] = []
+        self._journal: array | None = \
+            array("B", bytes(JOURNAL_SIZE)) if journal else None
+        self._journal_top: int = 0
+
+        # Running totals of power and occupied cells, and bitmasks of the
+        # occupied cell indices, indexed by PlayerColor and kept in sync by
+        # `_set_cell`.
+        self._color_powers: list[int] = [0, 0]
+        self._color_cells: list[int] = [0, 0]
+        self._color_masks: list[int] = [0, 0]
+        self._hash: int = 0
+        for cell, state in initial_state.items():
+            self._set_cell(cell, state)
+
+    def copy(self) -> 'Board':
+        """
+        Return an independent copy of the board, including its undo history,
+        so that actions can be applied to (and undone on) either board without
+        affecting the other.
+        """
+        b = self.snapshot()
+        b._history = self._history.copy()
+        if self._journal is not None:
+            b._journal[:self._journal_top] = self._journal[:self._journal_top]
+            b._journal_top = self._journal_top
+        return b
+
+    def snapshot(self) -> 'Board':
+        """
+        Return an independent copy of the current position with no undo
+        history. The turn count is kept, so the game ends at the same point.
+        """
+        b = Board.__new__(Board)
+        b._state = self._state.copy()
+        b._turn_color = self._turn_color
+        b._turn_count = self._turn_count
+        b._history = []
+        b._journal = None if self._journal is None \
+            else array("B", bytes(JOURNAL_SIZE))
+        b._journal_top = 0
+        b._color_powers = self._color_powers.copy()
+        b._color_cells = self._color_cells.copy()
+        b._color_masks = self._color_masks.copy()
+        b._hash = self._hash
+        return b
+
+    def get_hash(self) -> int:
+        """
+        Return the Zobrist key of the current position (including the player
+        to move), maintained incrementally by `apply_action`/`undo_action`.
+        """
+        return self._hash
 
-    def get_hash(self) -> str:
-        hash = ""
-        for cell in self._state.keys():
-            if self._state[cell].player != None:
-                player_short = "R" if self._state[cell].player == PlayerColor.RED else "B"
-                cell_short = str(cell).replace("-", "")
-                hash += f"{cell_short}:{player_short}{str(self._state[cell].power)},"   # r-q:COLOR<POWER> | eg. "00R1,10B2,..." : {...}
-
-        return hash
+    def successor_hash(self, move: int) -> int:
+        """
+        Return the Zobrist key of the position after a legal move, without
+        applying it.
+        """
+        color = self._turn_color.value
+        key = self._hash ^ ZOBRIST_TURN
+        if move >= SPAWN_MOVES:
+            return key ^ ZOBRIST_CELLS[move - SPAWN_MOVES][color][1]
+
+        from_idx, direction = divmod(move, NUM_DIRECTIONS)
+        from_power = self._state[CELLS[from_idx]].power
+        key ^= ZOBRIST_CELLS[from_idx][color][from_power]
+        for to_idx in SPREAD_RAY_INDICES[from_idx][direction][from_power]:
+            prev = self._state[CELLS[to_idx]]
+            if prev.player is not None:
+                key ^= ZOBRIST_CELLS[to_idx][prev.player.value][prev.power]
+            if prev.power < MAX_CELL_POWER:
+                key ^= ZOBRIST_CELLS[to_idx][color][prev.power + 1]
+        return key
 
     def __getitem__(self, cell: HexPos) -> CellState:
         """
@@ -90,27 +163,51 @@ class Board:
 
     def apply_action(self, action: Action):
         """
-        Apply an action to a board, mutating the board state. Throws an
-        IllegalActionException if the action is invalid.
+        Apply an action to a board, mutating the board state. Returns False
+        if the action is invalid.
         """
-        match action:
-            case SpawnAction():
-                res_action = self._resolve_spawn_action(action)
-            case SpreadAction():
-                res_action = self._resolve_spread_action(action)
-            case _:
-                return False
+        if not self.validate_action(action):
+            return False
+        self._apply(move_id(action))
 
-        for mutation in res_action.cell_mutations:
-            self._state[mutation.cell] = mutation.next
+    def apply_trusted(self, action: Action):
+        """
+        Apply an action that is known to be legal (e.g. one produced by our
+        own move generators), skipping validation.
+        """
+        self.apply_move(move_id(action))
+
+    def apply_move(self, move: int):
+        """
+        Apply a legal move given by its id (see moves.py), skipping
+        validation as for `apply_trusted`.
+        """
+        if constants.DEBUG_TRUSTED_ACTIONS \
+                and not self.validate_action(ACTIONS[move]):
+            raise IllegalActionException(
+                f"Trusted action {ACTIONS[move]} failed validation",
+                self._turn_color)
+        self._apply(move)
+
+    def pass_turn(self):
+        """
+        Pass the turn to the opponent without changing any cells (a "null
+        move", used by the search). This is not a legal action in the game,
+        but is undone by `undo_action` like one.
+        """
+        if self._journal is not None:
+            self._journal[self._journal_top] = 0
+            self._journal_top += 1
+        else:
+            self._history.append(BoardMutation(None, set()))
 
-        self._history.append(res_action)
+        self._turn_count += 1
         self._turn_color = self._turn_color.opponent
+        self._hash ^= ZOBRIST_TURN
 
     def validate_action(self, action: Action) -> bool:
         """
-        Apply an action to a board, mutating the board state. Throws an
-        IllegalActionException if the action is invalid.
+        Check whether an action can be legally applied to the board.
         """
         match action:
             case SpawnAction():
@@ -125,13 +222,27 @@ class Board:
         Undo the last action played, mutating the board state. Throws an
         IndexError if no actions have been played.
         """
-        if len(self._history) == 0:
-            raise IndexError("No actions to undo.")
-
-        action: BoardMutation = self._history.pop()
-        for mutation in action.cell_mutations:
-            self._state[mutation.cell] = mutation.prev
+        if self._journal is not None:
+            if self._journal_top == 0:
+                raise IndexError("No actions to undo.")
+
+            journal, top = self._journal, self._journal_top - 1
+            for _ in range(journal[top]):
+                top -= 2
+                self._set_cell(
+                    CELLS[journal[top]], PACKED_CELL_STATES[journal[top + 1]])
+            self._journal_top = top
+        else:
+            if len(self._history) == 0:
+                raise IndexError("No actions to undo.")
+
+            action: BoardMutation = self._history.pop()
+            for mutation in action.cell_mutations:
+                self._set_cell(mutation.cell, mutation.prev)
+
+        self._turn_count -= 1
         self._turn_color = self._turn_color.opponent
+        self._hash ^= ZOBRIST_TURN
 
     def render(self, use_color: bool=False, use_unicode: bool=False) -> str:
         """
@@ -157,8 +268,8 @@ class Board:
                 # Map row, col to r, q
                 r = max((dim - 1) - row, 0) + col
                 q = max(row - (dim - 1), 0) + col
-                if self._cell_occupied(HexPos(r, q)):
-                    color, power = self._state[HexPos(r, q)]
+                if self._cell_occupied(HexPos.at(r, q)):
+                    color, power = self._state[HexPos.at(r, q)]
                     color = "r" if color == PlayerColor.RED else "b"
                     text = f"{color}{power}".center(4)
                     if use_color:
@@ -176,7 +287,7 @@ class Board:
         """
         The number of actions that have been played so far.
         """
-        return len(self._history)
+        return self._turn_count
 
     @property
     def turn_color(self) -> PlayerColor:
@@ -193,11 +304,9 @@ class Board:
         if self.turn_count < 2: 
             return False
         
-        return any([
-            self.turn_count >= MAX_TURNS,
-            self._color_power(PlayerColor.RED) == 0,
-            self._color_power(PlayerColor.BLUE) == 0
-        ])
+        return self.turn_count >= MAX_TURNS \
+            or self._color_powers[PlayerColor.RED.value] == 0 \
+            or self._color_powers[PlayerColor.BLUE.value] == 0
     
     @property
     def winner_color(self) -> PlayerColor | None:
@@ -220,7 +329,7 @@ class Board:
         """
         The total power of all cells on the board.
         """
-        return sum(map(lambda cell: cell.power, self._state.values()))
+        return self._color_powers[0] + self._color_powers[1]
     
     def _player_cells(self, color: PlayerColor) -> list[CellState]:
         return list(filter(
@@ -229,11 +338,117 @@ class Board:
         ))
 
     def _color_power(self, color: PlayerColor) -> int:
-        return sum(map(lambda cell: cell.power, self._player_cells(color)))
+        return self._color_powers[color.value]
+
+    def _color_cell_count(self, color: PlayerColor) -> int:
+        return self._color_cells[color.value]
+
+    def _cell_power(self, idx: int) -> int:
+        """
+        The power of the stack at a cell index (0 if the cell is empty).
+        """
+        return self._state[CELLS[idx]].power
+
+    def _color_mask(self, color: PlayerColor) -> int:
+        """
+        Bitmask of the indices of the cells occupied by `color`.
+        """
+        return self._color_masks[color.value]
+
+    def _empty_mask(self) -> int:
+        """
+        Bitmask of the indices of the empty cells.
+        """
+        return ALL_CELLS_MASK ^ (self._color_masks[0] | self._color_masks[1])
+
+    def _set_cell(self, cell: HexPos, state: CellState):
+        """
+        Overwrite the state of a cell, keeping the power and cell counters and
+        the Zobrist key up to date.
+        """
+        idx = cell.r * BOARD_N + cell.q
+        zobrist = ZOBRIST_CELLS[idx]
+        prev = self._state[cell]
+        if prev.player is not None:
+            self._color_powers[prev.player.value] -= prev.power
+            self._color_cells[prev.player.value] -= 1
+            self._color_masks[prev.player.value] ^= 1 << idx
+            self._hash ^= zobrist[prev.player.value][prev.power]
+        if state.player is not None:
+            self._color_powers[state.player.value] += state.power
+            self._color_cells[state.player.value] += 1
+            self._color_masks[state.player.value] ^= 1 << idx
+            self._hash ^= zobrist[state.player.value][state.power]
+        self._state[cell] = state
     
+    def _apply(self, move: int):
+        """
+        Apply a validated move, recording how to undo it.
+        """
+        if self._journal is not None:
+            self._journal_move(move)
+        else:
+            action = ACTIONS[move]
+            match action:
+                case SpawnAction():
+                    res_action = self._resolve_spawn_action(action)
+                case SpreadAction():
+                    res_action = self._resolve_spread_action(action)
+
+            for mutation in res_action.cell_mutations:
+                self._set_cell(mutation.cell, mutation.next)
+            self._history.append(res_action)
+
+        self._turn_count += 1
+        self._turn_color = self._turn_color.opponent
+        self._hash ^= ZOBRIST_TURN
+
+    def _journal_cell(self, cell: HexPos, state: CellState):
+        """
+        Push the current state of a cell onto the journal, then overwrite it.
+        """
+        prev = self._state[cell]
+        top = self._journal_top
+        self._journal[top] = cell.r * BOARD_N + cell.q
+        self._journal[top + 1] = 0 if prev.player is None \
+            else prev.player.value << PACKED_POWER_BITS | prev.power
+        self._journal_top = top + 2
+        self._set_cell(cell, state)
+
+    def _journal_move(self, move: int):
+        """
+        Apply a validated move in journal mode, pushing a journal frame.
+        """
+        color = self._turn_color.value
+        if move >= SPAWN_MOVES:
+            self._journal_cell(CELLS[move - SPAWN_MOVES], CELL_STATES[color][1])
+            num_cells = 1
+        else:
+            from_idx, direction = divmod(move, NUM_DIRECTIONS)
+            from_cell = CELLS[from_idx]
+            to_cells = SPREAD_RAYS[from_idx][direction] \
+                [self._state[from_cell].power]
+            self._journal_cell(from_cell, EMPTY_CELL)
+            for to_cell in to_cells:
+                self._journal_cell(to_cell,
+                    CELL_STATES[color][self._state[to_cell].power + 1])
+            num_cells = 1 + len(to_cells)
+
+        self._journal[self._journal_top] = num_cells
+        self._journal_top += 1
+
+    def _occupied_cells(self) -> list[tuple[int, int]]:
+        """
+        Return a (cell index, packed state) pair for every occupied cell.
+        """
+        return [
+            (cell.r * BOARD_N + cell.q,
+             state.player.value << PACKED_POWER_BITS | state.power)
+            for cell, state in self._state.items() if state.player is not None
+        ]
+
     def _within_bounds(self, coord: HexPos) -> bool:
-        r, q = coord
-        return 0 <= r < BOARD_N and 0 <= q < BOARD_N
+        return 0 <= coord.r < BOARD_N and 0 <= coord.q < BOARD_N
     
     def _cell_occupied(self, coord: HexPos) -> bool:
         return self._state[coord].power > 0
@@ -271,15 +486,12 @@ class Board:
         return True
 
     def _resolve_spawn_action(self, action: SpawnAction) -> BoardMutation:
-        if not self._validate_spawn_action(action):
-            return
-
         cell = action.cell
 
         return BoardMutation(
             action,
             cell_mutations={CellMutation(cell, self._state[cell], 
-                                         CellState(self._turn_color, 1)
+                                         CELL_STATES[self._turn_color.value][1]
             )},
         )
     
@@ -295,26 +507,22 @@ class Board:
         return True
 
     def _resolve_spread_action(self, action: SpreadAction) -> BoardMutation:
-        if not self._validate_spread_action(action):
-            return
-
         from_cell, dir = action.cell, action.direction
         action_player: PlayerColor = self._turn_color
 
-        # Compute destination cell coords.
-        to_cells = [
-            from_cell + dir * (i + 1) for i in range(self[from_cell].power)
-        ]
+        # Look up destination cell coords.
+        to_cells = SPREAD_RAYS[from_cell.r * BOARD_N + from_cell.q] \
+            [DIRECTION_INDEX[dir]][self[from_cell].power]
 
         return BoardMutation(
             action,
             cell_mutations={
                 # Remove token stack from source cell.
-                CellMutation(from_cell, self[from_cell], CellState()),
+                CellMutation(from_cell, self[from_cell], EMPTY_CELL),
             } | {
                 # Add token stack to destination cells.
                 CellMutation(to_cell, self[to_cell], 
-                    CellState(action_player, self[to_cell].power + 1)
+                    CELL_STATES[action_player.value][self[to_cell].power + 1]
                 ) for to_cell in to_cells
             }
         )
@@ -1,4 +1,14 @@
 COLOUR = 0
 POWER = 1
 
-UCB_CONSTANT = 1.41
\ No newline at end of file
+UCB_CONSTANT = 1.41
+
+# Number of SPAWN moves searched at each minimax node, by game phase. Each
+# entry is (first turn count after the phase, limit); the last limit holds for
+# the rest of the game.
+SPAWN_LIMITS = ((12, 4), (150, 3), (None, 2))
+
+# When True, `apply_trusted` re-validates every action through the checked
+# `apply_action` path and raises if the two disagree. Only for debugging, as
+# it undoes the point of skipping validation.
+DEBUG_TRUSTED_ACTIONS = False
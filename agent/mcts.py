@@ -1,14 +1,15 @@
+import ast
 import random
 import math
 import csv
 from .minimax import MinimaxAgent
 from .board import Board
-from referee.game.actions import Action, SpawnAction, SpreadAction
-from referee.game.board import CellState
-from referee.game.constants import BOARD_N
-from referee.game.hex import HexDir, HexPos, HexVec
+from .moves import ACTIONS
+from referee.game.actions import Action
 from referee.game.player import PlayerColor
-from .utils import find_possible_actions
+from .transposition import ROLLOUT_TABLE_BYTES
+from .symmetry import canonical_key, transform_move, IDENTITY, SYMMETRY_INVERSE
+from .utils import find_possible_moves, dedupe_moves
 
 from .constants import UCB_CONSTANT
 
@@ -16,122 +17,96 @@ class MCTSAgent():
     """
     Monte Carlo Tree Search Agent
     """
-    def __init__(self, tree={}) -> None:
+    def __init__(self, tree={}, board_cls: type=Board, symmetry: bool=False, dedupe: bool=False) -> None:
         """
-        Tree representation of the MCTS tree. The tree is represented as a dictionary of hashed states, where each hashed state is a dictionary of the form:
-            hashed_state(str): {
+        Tree representation of the MCTS tree. The tree is represented as a dictionary of hashed states (Zobrist keys), where each hashed state is a dictionary of the form:
+            hashed_state(int): {
                 wins: int,
                 visits: int,
                 ucb: int,
-                children: [(move(Action), hashed_state(str)), (... , ...), ...],
-                parents: [hashed_state(str)]
+                children: [(move(int), hashed_state(int)), (... , ...), ...],
+                parents: [hashed_state(int)]
             }
+
+        Moves are stored as move ids (see moves.py). If `symmetry` is set, boards are hashed by their canonical key (see symmetry.py) so that symmetric positions share a node, and the moves stored in each node are relative to the canonical board.
+
+        If `dedupe` is set, moves leading to the same position (or a symmetric one, with `symmetry`) as an earlier move are not added as children.
         """
         self.tree = tree
+        self.board_cls = board_cls
+        self.symmetry = symmetry
+        self.dedupe = dedupe
     
     def print_tree(self):
         """
         Pretty print the MCTS tree as a table.
         """
         print()
-        print("{:100s} | {:10s} | {:10s} | {:10s} | {:10s} | {:10s} | {:5s}".format("hash", "wins", "visits", "ucb", "children", "parents", "is_red"))
+        print("{:20s} | {:10s} | {:10s} | {:10s} | {:10s} | {:10s} | {:5s}".format("hash", "wins", "visits", "ucb", "children", "parents", "is_red"))
         for hash, node in self.tree.items():
-            print("{:100s} | {:10.1f} | {:10.1f} | {:10f} | {:10d} | {:10d} | {:5s}".format(hash, node["wins"], node["visits"], node["ucb"], len(node["children"]), len(node["parents"]), str(node["is_red_turn"])))
+            print("{:20d} | {:10.1f} | {:10.1f} | {:10f} | {:10d} | {:10d} | {:5s}".format(hash, node["wins"], node["visits"], node["ucb"], len(node["children"]), len(node["parents"]), str(node["is_red_turn"])))
 
 
-    def hash(self, b: Board) -> str:
+    def hash(self, b: Board) -> int:
         """
-        Hashes the board state into a string, where each cell is represented as a string of the form: "r-q:COLOR<POWER>"
-        where r and q are the row and column of the cell, COLOR is either "R" or "B" for red or blue, and POWER is the power of the cell. 
-        Each cell is separated by commas (`,`).
+        Hashes the board state into its Zobrist key, which the board maintains incrementally as actions are applied and undone. With `symmetry` set, the key of the canonical form of the board is used instead.
 
         Arguments:
         b -- the board to hash
 
         Returns:
-        A string representing the board state
-        """
-        hash = ""
-        for i in range(BOARD_N):
-            for j in range(BOARD_N):
-                cell = HexPos(i, j)
-                if b[cell].player != None:
-                    player_short = "R" if b[cell].player == PlayerColor.RED else "B"
-                    cell_short = str(cell).replace("-", "")
-                    hash += f"{cell_short}{player_short}{str(b[cell].power)},"   # r-q:COLOR<POWER>
-        hash = hash.strip(",")
-        return hash
-    
-    def unhash(self, s: str) -> Board:
+        An integer key representing the board state and the player to move
         """
-        Unhashes the board state from a string, where each cell is represented as a string of the form: "r-q:COLOR<POWER>" to a Board object.
-
-        Arguments:
-        s -- the string to unhash
+        if self.symmetry:
+            return canonical_key(b)[0]
+        return b.get_hash()
 
-        Returns:
-        A Board object representing the board state.
-        """
-        new_board: Board = Board()
-        if s == "":
-            return new_board
-        for entry in s.split(","):
-            if len(entry) == 0:
-                continue
-            r, q, player_short, power = int(entry[0]), int(entry[1]), entry[2], int(entry[3])
-            player: PlayerColor = PlayerColor.RED if player_short == "R" else PlayerColor.BLUE
-            new_board._state[HexPos(r, q)] = CellState(player, power)
-        return new_board
-    
-    def unhash_action(self, s: str) -> Action:
+    def board_move(self, b: Board, move: int) -> int:
         """
-        Unhashes the action from a string of the form: "SPAWN(r, q)" or "SPREAD(r, q, dr, dq)" to an Action object.
+        Maps a move stored in the node for board `b` from the canonical board back onto `b` if `symmetry` is set.
 
         Arguments:
-            s -- the string to unhash
+            b -- the board in the node's position
+            move -- the stored move id
 
         Returns:
-            An Action object representing the action.
+            The id of a move that can be applied to `b`.
         """
-        if s.startswith("SPAWN"):
-            return SpawnAction(HexPos(int(s[6]), int(s[9])))
-        if s.startswith("SPREAD"):
-            pos = HexPos(int(s[7]), int(s[10]))
-            dir_r, dir_q = s[13:-1].split(", ")
-            dir = HexDir(HexVec(int(dir_r), int(dir_q)))
-            return SpreadAction(pos, dir)
-
-    def selection(self, parent_hash: str):
+        if self.symmetry:
+            move = transform_move(move, SYMMETRY_INVERSE[canonical_key(b)[1]])
+        return move
+
+    def selection(self, parent_hash: int, b: Board):
         """
         Start at the root node of the tree and recursively select the child node with the highest Upper Confidence Bound (UCB) until a leaf node is reached. The UCB value balances exploration (visiting less-visited nodes) and exploitation (favoring nodes with high estimated values).
 
+        The board `b` must be in the position of `parent_hash`; the actions along the selected path are applied to it, so that it is left in the position of the returned child.
+
         Arguments:
         parent_hash -- the hash of the parent node
+        b -- the board in the parent node's position
 
         Returns:
         A tuple of (parent_hash, child_hash)
         """
-        # print(f"SELECTION parent_hash: {parent_hash}")
         # Create parent node if not present in tree
         if parent_hash not in self.tree:
-            self.expansion(None, parent_hash)
+            self.expansion(None, parent_hash, b)
         
         # Select the child with the highest UCB value
         parent = self.tree[parent_hash]
         max_ucb = -1
-        max_ucb_hash = ""
-        for (action, child_hash) in parent["children"]:
+        max_ucb_hash = None
+        max_ucb_move = None
+        for (move, child_hash) in parent["children"]:
             if child_hash == None:
-                # Apply action to parent board
-                temp_board = self.unhash(parent_hash)
-                temp_board._turn_color = PlayerColor.RED if parent["is_red_turn"] else PlayerColor.BLUE
-                temp_board.apply_action(self.unhash_action(action))
+                # Apply move to parent board
+                b.apply_move(self.board_move(b, move))
 
                 # Update Child Node
-                child_hash = self.hash(temp_board)
-                self.tree[parent_hash]["children"].remove((action, None))
-                self.tree[parent_hash]["children"].append((action, child_hash))
-                # print(f"  Selecting child {child_hash} with action {str(action)}")
+                child_hash = self.hash(b)
+                self.tree[parent_hash]["children"].remove((move, None))
+                self.tree[parent_hash]["children"].append((move, child_hash))
                 return (parent_hash, child_hash)
 
             child = self.tree[child_hash]
@@ -140,15 +115,23 @@ class MCTSAgent():
             if child["ucb"] >= max_ucb and child_hash not in self.tree[parent_hash]["parents"]:
                 max_ucb = child["ucb"]
                 max_ucb_hash = child_hash
-        return self.selection(max_ucb_hash)
+                max_ucb_move = move
+
+        # Terminal node (or only cycles back up the tree): treat it as the leaf
+        if max_ucb_move is None:
+            return (None, parent_hash)
+
+        b.apply_move(self.board_move(b, max_ucb_move))
+        return self.selection(max_ucb_hash, b)
     
-    def expansion(self, parent_hash: str, child_hash: str):
+    def expansion(self, parent_hash: int, child_hash: int, b: Board):
         """
         Expand the tree by creating and adding a new child node to the parent node. The child node is created with its possible actions.
 
         Arguments:
         parent_hash -- the hash of the parent node
         child_hash -- the hash of the child node
+        b -- the board in the child node's position
 
         Returns:
         None
@@ -156,9 +139,12 @@ class MCTSAgent():
         # Only create the child node if it does not already exist
         if child_hash not in self.tree:
             # Create the new child node with its possible actions and add to the tree
-            is_red_turn = True if parent_hash in ["None", None] else not self.tree[parent_hash]["is_red_turn"]
-            actions: list[Action] = find_possible_actions(self.unhash(child_hash), PlayerColor.RED if is_red_turn else PlayerColor.BLUE, 2)
-            hashed_children = [(str(a), None) for a in actions]
+            is_red_turn = b.turn_color == PlayerColor.RED
+            moves: list[int] = find_possible_moves(b, b.turn_color, 2)
+            if self.dedupe:
+                moves = list(dedupe_moves(b, moves, self.symmetry))
+            symmetry = canonical_key(b)[1] if self.symmetry else IDENTITY
+            hashed_children = [(transform_move(m, symmetry), None) for m in moves]
             self.tree[child_hash] = {
                 "wins": 0,
                 "visits": 0,
@@ -167,17 +153,18 @@ class MCTSAgent():
                 "parents": [parent_hash],
                 "is_red_turn": is_red_turn
             }
-        else:
+        elif parent_hash not in self.tree[child_hash]["parents"]:
             # Add the parent to the existing child's list of parents
             self.tree[child_hash]["parents"].append(parent_hash)
-        # self.print_tree()
 
-    def simulation(self, child_hash: str, player: PlayerColor, minimax=False) -> float:
+    def simulation(self, b: Board, player: PlayerColor, minimax=False) -> float:
         """
-        Simulate a game from the given child node until a terminal state is reached. Return the reward of the terminal state.
+        Simulate a game from the given board until a terminal state is reached. Return the reward of the terminal state.
+
+        The game is played out on a snapshot of `b`, so `b` is left in its original position.
 
         Arguments:
-            child_hash -- the hash of the child node
+            b -- the board in the child node's position
             player -- the player to simulate for
 
         Returns:
@@ -186,39 +173,34 @@ class MCTSAgent():
             * 1 for a win
             * 0 for a loss
         """
-        # Create a temporary board from the child node
-        b = self.unhash(child_hash)
-        temp_board = Board(b._state)
-        temp_board._turn_color = PlayerColor.RED if self.tree[child_hash]["is_red_turn"] else PlayerColor.BLUE
-
-        # Simulate play from that new state
-        while not temp_board.game_over:
-            # print(f"Game Over: {temp_board.game_over}")
-
+        # Simulate play from the child's state
+        b = b.snapshot()
+        while not b.game_over:
             if minimax:
-                # Using minimax agent for simulation
-                minimaxAgent = MinimaxAgent(temp_board._turn_color)
-                action, cost = minimaxAgent.minimax(temp_board, 3, True, float('-inf'), float('inf'))
+                # Using minimax agent for simulation, with a small table as
+                # one is made for every ply
+                minimaxAgent = MinimaxAgent(b.turn_color, board_cls=self.board_cls,
+                                            table_bytes=ROLLOUT_TABLE_BYTES)
+                move, cost = minimaxAgent.minimax(b, 3, True, float('-inf'), float('inf'))
             else:
                 # Using random agent for simulation
-                action = random.choice(find_possible_actions(temp_board, temp_board._turn_color, 2))
+                move = random.choice(find_possible_moves(b, b.turn_color, 2))
             
-            # Apply the action to the temporary board
-            temp_board.apply_action(action)
-            # print(str(action))
-            # print(temp_board.render())
+            # Apply the move to the board
+            b.apply_move(move)
         
-        if temp_board.winner_color == None:
+        winner = b.winner_color
+        if winner == None:
             # Draw
             return 0.5
-        elif temp_board.winner_color == player:
+        elif winner == player:
             # Win
             return 1
         else:
             # Lost
             return 0
     
-    def backpropagation(self, isWin: int, child_hash: str, visited: list[str]=[]):
+    def backpropagation(self, isWin: int, child_hash: int, visited: list[int]=[]):
         """
         Update the wins, visits and UCB of the child node and all its parents
         
@@ -229,7 +211,7 @@ class MCTSAgent():
         ----------
         isWin : int
             1 if the player won, 0 otherwise
-        child_hash : str
+        child_hash : int
             hash of the child node
         new_action : Action
             action that led to the child node
@@ -246,8 +228,9 @@ class MCTSAgent():
 
         # use the parent with maximum visits to calculate UCB of child
         parent_visits = 0
-        if self.tree[child_hash]["parents"] != [None] and self.tree[child_hash]["parents"] != ["None"]:
-            parent_visits = max([self.tree[parent_hash]["visits"] for parent_hash in self.tree[child_hash]["parents"]])
+        parent_hashes = [p for p in self.tree[child_hash]["parents"] if p is not None]
+        if parent_hashes:
+            parent_visits = max([self.tree[parent_hash]["visits"] for parent_hash in parent_hashes])
         
         self.tree[child_hash]["ucb"] = (self.tree[child_hash]["wins"] / self.tree[child_hash]["visits"]) + UCB_CONSTANT * (math.sqrt(math.log(parent_visits) / self.tree[child_hash]["visits"]) if parent_visits != 0 else 0)
 
@@ -255,12 +238,9 @@ class MCTSAgent():
         # print(f'parents: {self.tree[child_hash]["parents"]}')
         for parent_hash in self.tree[child_hash]["parents"]:
             # Root Node
-            if parent_hash == None or parent_hash == "None":
+            if parent_hash == None:
                 continue
             # Prevent infinite recursion if parent is a child of the current node
-            child_hashes = [c for (_, c) in self.tree[parent_hash]["parents"]]
-            # print(child_hashes)
-            # print(parent_hash)
             if parent_hash in visited:
                 print("  recursive detected")
                 continue
@@ -275,40 +255,51 @@ class MCTSAgent():
         return
     
     
-    def mcts(self, num_iterations: int, minimax=False, b: Board=Board()) -> Action:
+    def mcts(self, num_iterations: int, minimax=False, b: Board=None) -> Action:
         """
         Run monte-carlo tree search for the specified number of iterations. Return the best action given the current board.
         """
+        if b is None:
+            b = self.board_cls()
         # self.tree = get_tree_from_csv("test.csv")
         # Run MCTS for `num_iterations`
+        root_turn = b.turn_count
         for i in range(num_iterations):
             # print(f"\nMCTS Iteration {i}")
-            parent_hash, child_hash = self.selection(self.hash(b))
-            self.expansion(parent_hash, child_hash)
+            parent_hash, child_hash = self.selection(self.hash(b), b)
+            self.expansion(parent_hash, child_hash, b)
             # print(child_hash)
-            isWin = self.simulation(child_hash, PlayerColor.RED, minimax)
+            isWin = self.simulation(b, PlayerColor.RED, minimax)
             self.backpropagation(isWin, child_hash, [])
+
+            # Walk the board back up the selected path to the root
+            while b.turn_count > root_turn:
+                b.undo_action()
         # Find best action for current board
         parent_hash = self.hash(b)
         children = self.tree[parent_hash]["children"]
         # find for child with the highest win rate
         best_winrate = -1
-        best_action = None
-        for child_action, child_hash in children:
+        best_move = None
+        for child_move, child_hash in children:
             if child_hash == None:
                 continue
             curr_winrate = self.tree[child_hash]["wins"]/self.tree[child_hash]["visits"]
             if curr_winrate > best_winrate:
                 best_winrate = curr_winrate
-                best_action = child_action
-        print(f"\nbest action: {best_action}, winrate: {best_winrate}")
-        return self.unhash_action(best_action)
+                best_move = child_move
+        print(f"\nbest action: {ACTIONS[best_move]}, winrate: {best_winrate}")
+        return ACTIONS[self.board_move(b, best_move)]
 
         # self.print_tree()
 
     def get_tree_from_csv(self, filename):
         """
-        
+        Load a tree saved by `save_tree_to_csv`, creating an empty csv file if
+        it does not exist.
+
+        Arguments:
+            filename: name of csv file
         """
         tree = {}
         try:
@@ -317,22 +308,12 @@ class MCTSAgent():
 
             # Converting string representation of children to list of tuples
             for row in reader:
-                children = []
-                for c in row["children"].strip("[]").split("), ("):
-                    if "None" in c:
-                        c = c.strip("()").replace("'", "")
-                        action = c.strip(", None")
-                        children.append((action, None))
-                    else:
-                        c = c.strip("()").split("', '")
-                        c = [ele.replace("'", "") for ele in c]
-                        children.append(tuple(c))
-                tree[row["hash"]] = {
+                tree[int(row["hash"])] = {
                     "wins": float(row["wins"]),
                     "visits": float(row["visits"]),
                     "ucb": float(row["ucb"]),
-                    "children": children,
-                    "parents": [p.strip("''") for p in row["parents"].strip("[]").split("', '")],
+                    "children": ast.literal_eval(row["children"]),
+                    "parents": ast.literal_eval(row["parents"]),
                     "is_red_turn": True if row["is_red_turn"] == "True" else False
                 }
             fp.close()
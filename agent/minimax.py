@@ -1,16 +1,75 @@
-from argparse import Action
+from time import process_time
 from .board import Board
-from .transposition import Transposition
-from .utils import find_possible_actions
+from .timing import TimeManager
+from .symmetry import canonical_key, transform_move, IDENTITY, SYMMETRY_INVERSE
+from .transposition import Transposition, DEFAULT_TABLE_BYTES
+from .moves import NUM_DIRECTIONS
+from .utils import find_possible_moves, ordered_moves, phase_spawn_limit, \
+    dedupe_moves, find_capture_moves
 from referee.game.player import PlayerColor
 
+# Deepest iteration of `MinimaxAgent.search`.
+MAX_SEARCH_DEPTH = 12
+
+# How often (in nodes) the search checks its deadline.
+DEADLINE_CHECK_NODES = 256
+
+# Deepest line of captures followed by the quiescence search.
+MAX_QUIESCENCE_DEPTH = 8
+
+# Aspiration windows: the first search of each iteration only looks for
+# scores within ASPIRATION_WINDOW of the previous iteration's, and the window
+# grows by ASPIRATION_GROWTH times each time the score falls outside it.
+ASPIRATION_WINDOW = 1
+ASPIRATION_GROWTH = 2
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when its deadline has passed.
+    """
+
+
 class MinimaxAgent():
-    def __init__(self, color: PlayerColor, eval_func: str="eval_func1") -> None:
+    def __init__(self, color: PlayerColor, eval_func: str="eval_func1",
+                 board_cls: type=Board, symmetry: bool=False,
+                 move_ordering: bool=True, dedupe: bool=False,
+                 table_bytes: int=DEFAULT_TABLE_BYTES,
+                 quiescence: bool=True, aspiration: bool=True) -> None:
         self._color = color
-        self._state: Board = Board()
-        self.transposition_table = Transposition()
+        self.board_cls = board_cls
+        self.transposition_table = Transposition(table_bytes)
         self.opponent = PlayerColor.RED if color == PlayerColor.BLUE else PlayerColor.BLUE
         self.eval_func: str = eval_func
+        self.nodes: int = 0
+
+        # CPU time (`time.process_time`) at which a search must stop, if any,
+        # and the deepest iteration completed by the last `search`.
+        self.deadline: float | None = None
+        self.completed_depth: int = 0
+
+        # Key the transposition table on the canonical form of each position,
+        # so that entries are shared between symmetric positions.
+        self.symmetry: bool = symmetry
+
+        # Search moves through the staged `ordered_moves` generator (TT move,
+        # captures, other spreads, spawns) rather than in generation order.
+        self.move_ordering: bool = move_ordering
+
+        # Skip moves that lead to the same position as an earlier move (or,
+        # with `symmetry`, to a symmetric one).
+        self.dedupe: bool = dedupe
+
+        # Extend the leaves of the search through captures until the
+        # position is quiet, rather than evaluating them as they are.
+        self.quiescence: bool = quiescence
+
+        # Start each iteration of `search` with an aspiration window around
+        # the score of the last one (kept in `last_score`), rather than a full
+        # window. `researches` counts the searches repeated with a wider one.
+        self.aspiration: bool = aspiration
+        self.last_score: int | None = None
+        self.researches: int = 0
 
     def evaluate_value(self, b: Board) -> int:
         """
@@ -26,14 +85,7 @@ class MinimaxAgent():
             If the agent is red, the value is
                 red power - blue power
         """
-        power = 0
-        for cell in b._state:
-            if b[cell].power > 0:
-                if b[cell].player == self._color:
-                    power += b[cell].power
-                else:
-                    power -= b[cell].power
-        return power
+        return b._color_power(self._color) - b._color_power(self.opponent)
     
     def evaluate_value2(self, b: Board) -> int:
         """
@@ -49,17 +101,165 @@ class MinimaxAgent():
             If the agent is red, the value is
                 (red power - blue power) + (red cells - blue cells)
         """
-        power = 0
-        for cell in b._state:
-            if b[cell].power > 0:
-                if b[cell].player == self._color:
-                    power += b[cell].power
-                else:
-                    power -= b[cell].power
-        power += (len(b._player_cells(self._color)) - len(b._player_cells(self.opponent)))
+        power = b._color_power(self._color) - b._color_power(self.opponent)
+        power += (b._color_cell_count(self._color) - b._color_cell_count(self.opponent))
         return power
 
-    def minimax(self, b: Board, depth: int, is_max: bool, alpha: int, beta: int) -> tuple[Action, int]:
+    def capture_bound(self, b: Board, move: int, gain: int) -> int:
+        """
+        Bound how much a capturing SPREAD can change the evaluation, for
+        delta pruning in the quiescence search.
+
+        Args:
+            b (Board): The board before the move
+            move (int): The id of the SPREAD move
+            gain (int): The opponent power it captures
+
+        Returns:
+            int: The most the move can change the agent's evaluation by
+
+        Example:
+            Capturing a power 2 stack moves 2 power from the opponent to the
+            spreading player, changing the difference in power by 4. Stacks
+            reaching the maximum power vanish, which can only lower this.
+        """
+        if self.eval_func == "eval_func1":
+            return 2 * gain
+        # Each captured cell is worth at least 1 power, and each empty cell
+        # on the ray adds at most one more cell.
+        return 4 * gain + b._cell_power(move // NUM_DIRECTIONS)
+
+    def search(self, b: Board, timer: TimeManager | None=None,
+               max_depth: int=MAX_SEARCH_DEPTH) -> int:
+        """
+        Iterative deepening: search depth 1, 2, 3, ... until `max_depth` is
+        reached or the time manager says to stop, returning the best move of
+        the last completed iteration. The transposition table is kept between
+        iterations, so each one searches the best moves found by the previous
+        ones first.
+
+        Args:
+            b (Board): The board to search, with the agent to move
+            timer (TimeManager | None): The time manager of the move, already
+                started, or None to always search to `max_depth`
+            max_depth (int): The deepest iteration
+
+        Returns:
+            int: The id of the best move (see moves.py)
+        """
+        root_turn = b.turn_count
+        best_move = None
+        self.transposition_table.new_search()
+        self.completed_depth = 0
+        self.last_score = None
+        last_elapsed = 0.0
+
+        for depth in range(1, max_depth + 1):
+            if timer is not None:
+                self.deadline = timer.hard_deadline
+            iteration_start = process_time()
+            try:
+                move, score = self.search_depth(b, depth)
+            except SearchTimeout:
+                # Abandon the unfinished iteration, unwinding the board. If
+                # not even depth 1 finished, fall back on a move that needs
+                # no search.
+                while b.turn_count > root_turn:
+                    b.undo_action()
+                if best_move is None:
+                    best_move = self.fallback_move(b)
+                break
+            finally:
+                self.deadline = None
+
+            best_move = move
+            self.completed_depth = depth
+            self.last_score = score
+            if self.is_decisive(score):
+                # The result is forced, searching deeper won't change it.
+                break
+
+            # Stop if the next iteration is unlikely to finish in time,
+            # assuming it grows by the same factor as this one did.
+            elapsed = process_time() - iteration_start
+            if timer is not None:
+                timer.iteration_done(best_move)
+                growth = max(elapsed / last_elapsed, 2.0) if last_elapsed > 0 else 2.0
+                if timer.should_stop(elapsed * growth):
+                    break
+            last_elapsed = elapsed
+
+        return best_move
+
+    def fallback_move(self, b: Board) -> int:
+        """
+        A move to play when not even the first search iteration finished in
+        time: the transposition table's move for the position if it has one,
+        and otherwise the first move from `ordered_moves` (the best capture,
+        if there is one).
+        """
+        if self.symmetry:
+            b_hash, symmetry = canonical_key(b)
+        else:
+            b_hash, symmetry = b.get_hash(), IDENTITY
+        _, _, tt_move = self.transposition_table.find(
+            b_hash, 0, float('-inf'), float('inf'))
+        if tt_move is not None:
+            tt_move = transform_move(tt_move, SYMMETRY_INVERSE[symmetry])
+        return next(ordered_moves(b, b.turn_color, tt_move, phase_spawn_limit(b)))
+
+    def search_depth(self, b: Board, depth: int) -> tuple[int, int]:
+        """
+        Search the board to a fixed depth, as one iteration of `search`.
+
+        With `aspiration` set, and the score of the previous iteration known,
+        the search first uses a narrow window around that score. If the score
+        falls outside the window it is only a bound, so the search is repeated
+        with the window widened on that side, until the score falls inside.
+
+        Returns:
+            tuple[int, int]: The id of the best move and its score
+        """
+        low, high = self.score_range()
+        guess = self.last_score
+        if not self.aspiration or guess is None or self.is_decisive(guess):
+            return self.search_window(b, depth, low, high)
+
+        delta = ASPIRATION_WINDOW
+        alpha, beta = guess - delta, guess + delta
+        while True:
+            move, score = self.search_window(b, depth, alpha, beta)
+            if score <= alpha and alpha > low:
+                alpha = low if self.is_decisive(score) else max(score - delta, low)
+            elif score >= beta and beta < high:
+                beta = high if self.is_decisive(score) else min(score + delta, high)
+            else:
+                return move, score
+            self.researches += 1
+            delta *= ASPIRATION_GROWTH
+
+    def search_window(self, b: Board, depth: int, alpha: int, beta: int) -> tuple[int, int]:
+        """
+        Search the board to a fixed depth within the window (alpha, beta).
+
+        Returns:
+            tuple[int, int]: The id of the best move and its score
+        """
+        return self.minimax(b, depth, True, alpha, beta)
+
+    def score_range(self) -> tuple[int, int]:
+        """
+        The lowest and highest scores the search can return.
+        """
+        return float('-inf'), float('inf')
+
+    def is_decisive(self, score: int) -> bool:
+        """
+        Whether a search score means the game result is already decided.
+        """
+        return score in (float('inf'), float('-inf'))
+
+    def minimax(self, b: Board, depth: int, is_max: bool, alpha: int, beta: int) -> tuple[int, int]:
         """
         Minimax algorithm with alpha-beta pruning.
 
@@ -71,9 +271,15 @@ class MinimaxAgent():
             beta (int): The beta value
 
         Returns:
-            tuple[Action, int]: The best action and the evaluated value/cost of the board
+            tuple[int, int]: The id of the best move (see moves.py) and the evaluated value/cost of the board
         """
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % DEADLINE_CHECK_NODES == 0 \
+                and process_time() > self.deadline:
+            raise SearchTimeout()
         if depth == 0:
+            if self.quiescence:
+                return None, self.quiesce(b, is_max, alpha, beta)
             if self.eval_func == "eval_func1":
                 return None, self.evaluate_value(b)
             return None, self.evaluate_value2(b)
@@ -87,28 +293,42 @@ class MinimaxAgent():
         
         alpha_org = alpha
         beta_org = beta
-        b_hash = b.get_hash()
+        if self.symmetry:
+            b_hash, symmetry = canonical_key(b)
+        else:
+            b_hash, symmetry = b.get_hash(), IDENTITY
 
         # Probe the transposition table to see if we have a useable matching
         # entry from the current position. If we get a hit, return the score
         # and stop searching.
         tt_score, should_use, best_move = self.transposition_table.find(b_hash, depth, alpha, beta)
 
-        # If we got a hit, return the score and stop searching
+        # If we got a hit, return the score and stop searching. Moves are
+        # stored relative to the canonical board, so map it back onto ours.
         if should_use:
-            return best_move, tt_score
+            return transform_move(best_move, SYMMETRY_INVERSE[symmetry]), tt_score
 
-        # If we didn't get a hit, generate all possible actions from that board state
+        # If we didn't get a hit, generate the possible actions from that
+        # board state, trying the best move found by an earlier search first
         colour = self._color if is_max else self._color.opponent
         curr_max = float('-inf')
         curr_min = float('inf')
-        all_actions = find_possible_actions(b, colour)
+        if self.move_ordering:
+            if best_move is not None:
+                best_move = transform_move(best_move, SYMMETRY_INVERSE[symmetry])
+            all_actions = ordered_moves(b, colour, best_move, phase_spawn_limit(b))
+        else:
+            all_actions = find_possible_moves(b, colour, phase_spawn_limit(b))
+        if self.dedupe:
+            all_actions = dedupe_moves(b, all_actions, self.symmetry)
 
         # Find the best action and the cost of that action
-        best_action = all_actions[0]
+        best_action = None
         for action in all_actions:
+            if best_action is None:
+                best_action = action
             # Apply the action to the board and recursively call minimax to find the cost
-            b.apply_action(action)
+            b.apply_move(action)
             _, val = self.minimax(b, depth-1, not is_max, alpha, beta)
 
             # Compare the cost to the current max/min and update if necessary
@@ -132,7 +352,80 @@ class MinimaxAgent():
             cost = curr_max
         else:
             cost = curr_min
-        b_hash = self._state.get_hash()
-        self.transposition_table.store(b_hash, cost, best_action, depth, alpha_org, beta_org)
+        self.transposition_table.store(b_hash, cost, transform_move(best_action, symmetry), depth, alpha_org, beta_org)
         
         return best_action, cost
+
+    def quiesce(self, b: Board, is_max: bool, alpha: int, beta: int, qdepth: int=0) -> int:
+        """
+        Quiescence search, extending a leaf of `minimax` through the SPREAD
+        moves that capture opponent cells until the position is quiet, so
+        that it isn't evaluated in the middle of an exchange.
+
+        The player to move may "stand pat" (decline to capture) and take the
+        static evaluation, so this can cut off as soon as that is good enough.
+        Captures that can't reach alpha (or beta, for min) even in the best
+        case (see `capture_bound`) are skipped (delta pruning), unless they
+        capture every opponent cell and so win the game.
+
+        Args:
+            b (Board): The board to evaluate
+            is_max (bool): Whether the current node is a max node or not
+            alpha (int): The alpha value
+            beta (int): The beta value
+            qdepth (int): The number of captures since the leaf
+
+        Returns:
+            int: The evaluated value/cost of the board
+        """
+        if self.deadline is not None and self.nodes % DEADLINE_CHECK_NODES == 0 \
+                and process_time() > self.deadline:
+            raise SearchTimeout()
+        if b.game_over:
+            return float('inf') if b.winner_color == self._color else float('-inf')
+
+        if self.eval_func == "eval_func1":
+            stand_pat = self.evaluate_value(b)
+        else:
+            stand_pat = self.evaluate_value2(b)
+        if qdepth >= MAX_QUIESCENCE_DEPTH:
+            return stand_pat
+        if is_max:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            beta = min(beta, stand_pat)
+
+        best = stand_pat
+        opponent_power = b._color_power(b.turn_color.opponent)
+        for gain, move in find_capture_moves(b, b.turn_color):
+            # Delta pruning: skip a capture that can't bring the score back
+            # into the window, keeping its best case as a fail-soft bound.
+            # Winning captures are always searched.
+            bound = self.capture_bound(b, move, gain)
+            if gain < opponent_power:
+                if is_max and stand_pat + bound <= alpha:
+                    best = max(best, stand_pat + bound)
+                    continue
+                if not is_max and stand_pat - bound >= beta:
+                    best = min(best, stand_pat - bound)
+                    continue
+
+            b.apply_move(move)
+            self.nodes += 1
+            val = self.quiesce(b, not is_max, alpha, beta, qdepth + 1)
+            b.undo_action()
+
+            if is_max and val > best:
+                best = val
+                alpha = max(alpha, best)
+            elif not is_max and val < best:
+                best = val
+                beta = min(beta, best)
+            if beta <= alpha:
+                break
+
+        return best
@@ -0,0 +1,34 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+from referee.game.actions import Action, SpawnAction, SpreadAction
+
+from .tables import CELLS, DIRECTIONS, NUM_CELLS
+
+# Inside the search, moves are numbered by a single integer id rather than
+# passed around as Action objects: SPREAD from cell index c in direction index
+# d is `c * NUM_DIRECTIONS + d`, and SPAWN at cell index c is `SPAWN_MOVES + c`.
+# Ids are only turned into Actions (through ACTIONS) when a move leaves the
+# agent, and Actions from the referee are turned into ids with `move_id`.
+
+NUM_DIRECTIONS = len(DIRECTIONS)
+SPAWN_MOVES = NUM_CELLS * NUM_DIRECTIONS
+NUM_MOVES = SPAWN_MOVES + NUM_CELLS
+
+# ACTIONS[move] is the shared Action instance for each move id.
+ACTIONS: tuple[Action, ...] = tuple(
+    SpreadAction(cell, direction) for cell in CELLS for direction in DIRECTIONS
+) + tuple(
+    SpawnAction(cell) for cell in CELLS
+)
+
+MOVE_IDS: dict[Action, int] = {
+    action: move for move, action in enumerate(ACTIONS)
+}
+
+
+def move_id(action: Action) -> int:
+    """
+    Return the id of an action.
+    """
+    return MOVE_IDS[action]
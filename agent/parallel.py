@@ -0,0 +1,244 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from time import process_time
+
+from referee.game.player import PlayerColor
+
+from .board import Board
+from .minimax import SearchTimeout, MAX_SEARCH_DEPTH
+from .pvs import PVSAgent, INF_SCORE
+from .timing import TimeManager
+
+# Shallowest iteration whose root moves are split between the workers. Below
+# this, an iteration takes less time than it would take to send the board
+# to the workers.
+PARALLEL_MIN_DEPTH = 3
+
+# Slots of the shared bound window: the id of the split the window belongs
+# to, and the best score found by any move of that split so far.
+WINDOW_SPLIT_ID = 0
+WINDOW_ALPHA = 1
+WINDOW_SIZE = 2
+
+
+# The ParallelAgent class splits the root moves of each search iteration
+# between a pool of worker processes (a "root split"). Following "young
+# brothers wait", the first (expected best) root move is searched in this
+# process, to get a good alpha; the others are then searched by the workers,
+# each with a null window around the best score found so far. The workers
+# share that score through a small window of shared memory, so that a good
+# move found by one worker narrows the searches of the others.
+#
+# Each worker keeps its own `PVSAgent` (with its own transposition table,
+# killers and history) for the whole game. The referee's CountdownTimer only
+# measures the agent's own process, so each worker reports the CPU time it
+# used back to the agent, which charges it to the move (`TimeManager.charge`)
+# and keeps the total used by each worker in `worker_times`.
+
+class ParallelAgent(PVSAgent):
+    """
+    Principal variation search with the root moves split across
+    `num_workers` worker processes (see above), or in this process only if
+    `num_workers` is 0. The process pool is created with the agent and
+    reused for every search. Other arguments are as for `PVSAgent`, and are
+    also used to create the workers' agents.
+    """
+    def __init__(self, color: PlayerColor, *args, num_workers: int=0,
+                 **kwargs) -> None:
+        super().__init__(color, *args, **kwargs)
+        self.num_workers: int = num_workers
+
+        # CPU seconds used by each worker (by process id) over the game.
+        self.worker_times: dict[int, float] = {}
+
+        self._timer: TimeManager | None = None
+        self._split_id: int = 0
+        self._window = None
+        self._pool: ProcessPoolExecutor | None = None
+        if num_workers > 0:
+            # Workers are spawned rather than forked: a forked worker would
+            # inherit the referee's stdin override, which multiprocessing
+            # can't close, and die on start-up.
+            context = multiprocessing.get_context("spawn")
+            self._window = context.Array("q", WINDOW_SIZE)
+            self._pool = ProcessPoolExecutor(
+                num_workers, mp_context=context, initializer=_init_worker,
+                initargs=(self._window, color, args, kwargs))
+            weakref.finalize(self, self._pool.shutdown, cancel_futures=True)
+
+    @property
+    def worker_time(self) -> float:
+        """
+        Total CPU seconds used by the workers over the game.
+        """
+        return sum(self.worker_times.values())
+
+    def close(self):
+        """
+        Shut down the worker processes.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def charge(self, seconds: float):
+        """
+        Charge CPU time used by a worker to the current move.
+        """
+        if self._timer is not None:
+            self._timer.charge(seconds)
+        if self.deadline is not None:
+            self.deadline -= seconds
+
+    def search(self, b: Board, timer: TimeManager | None=None,
+               max_depth: int=MAX_SEARCH_DEPTH) -> int:
+        self._timer = timer
+        try:
+            return super().search(b, timer, max_depth)
+        finally:
+            self._timer = None
+
+    def search_window(self, b: Board, depth: int, alpha: int, beta: int) -> tuple[int, int]:
+        if self._pool is None or depth < PARALLEL_MIN_DEPTH:
+            return super().search_window(b, depth, alpha, beta)
+
+        self.nodes += 1
+        self._follow_pv = True
+        moves = list(self.node_moves(b, self.pv[0] if self.pv else None, 0))
+
+        # Young brothers wait: search the eldest move first, here.
+        b.apply_move(moves[0])
+        best_score = -self.pvs(b, depth - 1, -beta, -alpha, 1)
+        b.undo_action()
+        self._follow_pv = False
+        best_move, pv = moves[0], [moves[0]] + self._pv_table[1]
+
+        if best_score < beta and len(moves) > 1:
+            self._split_id += 1
+            with self._window.get_lock():
+                self._window[WINDOW_SPLIT_ID] = self._split_id
+                self._window[WINDOW_ALPHA] = int(max(alpha, best_score))
+
+            # Share the time left between the workers, as they run at once.
+            time_left = None
+            if self.deadline is not None:
+                time_left = max(self.deadline - process_time(), 0.0) \
+                    / self.num_workers
+
+            root = b.snapshot()
+            futures = [
+                self._pool.submit(_search_move, root, move, depth, beta,
+                                  self._split_id, time_left)
+                for move in moves[1:]
+            ]
+            timed_out = False
+            for future in futures:
+                if future.cancelled():
+                    continue
+                move, score, proven, line, pid, cpu, nodes = future.result()
+                self.worker_times[pid] = self.worker_times.get(pid, 0.0) + cpu
+                self.nodes += nodes
+                self.charge(cpu)
+                if score is None:
+                    # A worker ran out of time, so the iteration can't finish.
+                    timed_out = True
+                    for pending in futures:
+                        pending.cancel()
+                elif proven and score > best_score:
+                    # Only a score that beat the worker's alpha is exact (or
+                    # a cutoff); one that failed low is only an upper bound.
+                    best_move, best_score = move, score
+                    pv = [move] + line
+
+            if timed_out:
+                raise SearchTimeout()
+
+        # As in `PVSAgent.search_window`, keep the old variation on a fail low.
+        if best_score > alpha:
+            self.pv = pv
+        return best_move, best_score
+
+
+# State of a worker process, set up by `_init_worker`: the worker's agent,
+# the shared bound window, and the split being searched with the CPU time
+# used on it so far.
+_worker_agent: PVSAgent | None = None
+_worker_window = None
+_worker_split: tuple[int, float] = (0, 0.0)
+_worker_turn: int | None = None
+
+
+def _init_worker(window, color: PlayerColor, args: tuple, kwargs: dict):
+    """
+    Set up a worker process with its own agent.
+    """
+    global _worker_agent, _worker_window
+    _worker_agent = PVSAgent(color, *args, **kwargs)
+    _worker_window = window
+
+
+def _search_move(b: Board, move: int, depth: int, beta: int, split_id: int,
+                 time_left: float | None) -> tuple:
+    """
+    Search a root move in a worker process, with a null window around the
+    best score shared by the split so far and a full re-search if it is
+    better, raising the shared score if so.
+
+    Returns:
+        tuple: The move, its score (None if the search ran out of time),
+        whether the score beat the shared score (if not, it is only an upper
+        bound), the rest of its principal variation, the worker's process id,
+        and the CPU time and nodes used
+    """
+    global _worker_split, _worker_turn
+    start = process_time()
+    agent = _worker_agent
+    agent.nodes = 0
+
+    # Age the worker's tables once per turn, as `PVSAgent.search` does.
+    if b.turn_count != _worker_turn:
+        _worker_turn = b.turn_count
+        agent.new_turn()
+        agent.transposition_table.new_search()
+
+    # The time left is shared by all the moves of the split this worker
+    # searches.
+    if _worker_split[0] != split_id:
+        _worker_split = (split_id, 0.0)
+    if time_left is not None:
+        agent.deadline = start + time_left - _worker_split[1]
+
+    score, proven, line = None, False, []
+    b.apply_move(move)
+    try:
+        with _worker_window.get_lock():
+            if _worker_window[WINDOW_SPLIT_ID] != split_id:
+                raise SearchTimeout()
+            alpha = _worker_window[WINDOW_ALPHA]
+        if alpha < beta:
+            score = -agent.pvs(b, depth - 1, -alpha - 1, -alpha, 1)
+            if alpha < score < beta:
+                score = -agent.pvs(b, depth - 1, -beta, -alpha, 1)
+            proven = score > alpha
+            line = agent._pv_table[1].copy()
+            with _worker_window.get_lock():
+                if proven and _worker_window[WINDOW_SPLIT_ID] == split_id \
+                        and score > _worker_window[WINDOW_ALPHA]:
+                    _worker_window[WINDOW_ALPHA] = int(score)
+        else:
+            # Another move has already failed high, so this one is moot.
+            score = -INF_SCORE
+    except SearchTimeout:
+        # The board is a copy, so it needn't be unwound.
+        score = None
+    finally:
+        agent.deadline = None
+
+    cpu = process_time() - start
+    _worker_split = (split_id, _worker_split[1] + cpu)
+    return move, score, proven, line, os.getpid(), cpu, agent.nodes
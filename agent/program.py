@@ -1,13 +1,27 @@
 # COMP30024 Artificial Intelligence, Semester 1 2023
 # Project Part B: Game Playing Agent
 
-from .minimax import MinimaxAgent
+from .parallel import ParallelAgent
+from .moves import ACTIONS
+from .timing import TimeManager
+from .transposition import table_bytes
 from referee.game import \
     PlayerColor, Action
 from .board import Board
+from .bitboard import BitBoard
 
+# Search depth used when the game has no time limit.
 MAX_DEPTH = 3
 
+
+# Board representation used by the agent's search (`Board` or `BitBoard`).
+BOARD_CLASS = BitBoard
+
+# Number of worker processes to split the search between (0 to search in the
+# agent's own process only). The referee only times the agent's own process,
+# so the agent charges the workers' CPU time to its clock itself.
+NUM_WORKERS = 0
+
 # This is the entry point for your game playing agent. Currently the agent
 # simply spawns a token at the centre of the board if playing as RED, and
 # spreads a token at the centre of the board if playing as BLUE. This is
@@ -20,20 +34,29 @@ class Agent:
         Initialise the agent.
         """
         self._color = color
-        self._state: Board = Board()
+        self._state: Board = BOARD_CLASS()
         match color:
             case PlayerColor.RED:
                 self.opponent = PlayerColor.BLUE
             case PlayerColor.BLUE:
                 self.opponent = PlayerColor.RED
-        self._agent = MinimaxAgent(self._color, "eval_func1")
+        self._agent = ParallelAgent(self._color, "eval_func1", BOARD_CLASS,
+            table_bytes=table_bytes(referee.get("space_remaining")),
+            num_workers=NUM_WORKERS)
+        self._timer = TimeManager()
 
     def action(self, **referee: dict) -> Action:
         """
         Return the next action to take.
         """
-        action, _ = self._agent.minimax(self._state, MAX_DEPTH, True, float('-inf'), float('inf'))
-        return action
+        time_remaining = referee.get("time_remaining")
+        if time_remaining is None:
+            move = self._agent.search(self._state, max_depth=MAX_DEPTH)
+        else:
+            self._timer.start(self._state,
+                              time_remaining - self._agent.worker_time)
+            move = self._agent.search(self._state, self._timer)
+        return ACTIONS[move]
     
     def turn(self, color: PlayerColor, action: Action, **referee: dict):
         """
@@ -0,0 +1,385 @@
+from .board import Board
+from .minimax import MinimaxAgent, SearchTimeout, DEADLINE_CHECK_NODES, \
+    MAX_QUIESCENCE_DEPTH
+from .symmetry import canonical_key, transform_move, IDENTITY, SYMMETRY_INVERSE
+from .moves import NUM_MOVES
+from .utils import find_possible_moves, ordered_moves, phase_spawn_limit, \
+    dedupe_moves, is_capture_move, find_capture_moves
+from referee.game.constants import MAX_CELL_POWER
+from referee.game.player import PlayerColor
+
+from time import process_time
+from typing import Iterable
+
+# Score of a won position. Wins are scored WIN_SCORE - ply (and losses the
+# negation), so that quicker wins and slower losses are preferred, and any
+# score within MAX_PLY of WIN_SCORE is decisive.
+WIN_SCORE = 10000
+MAX_PLY = 128
+
+# Bound on every score, used as the initial search window.
+INF_SCORE = WIN_SCORE + 1
+
+# Number of killer moves kept for each ply.
+NUM_KILLERS = 2
+
+# Null move pruning: the null move is searched this many plies shallower than
+# a real move would be, at nodes at least NULL_MOVE_MIN_DEPTH deep.
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+
+# Late move reductions: quiet moves after the first LMR_MIN_MOVES, at nodes at
+# least LMR_MIN_DEPTH deep, are first searched LMR_REDUCTION plies shallower.
+LMR_MIN_MOVES = 3
+LMR_MIN_DEPTH = 3
+LMR_REDUCTION = 1
+
+
+def score_to_table(score: int, ply: int) -> int:
+    """
+    Convert a win/loss score at `ply` to one relative to the node it is
+    stored for, so that it stays valid wherever the position is reached.
+    """
+    if score >= WIN_SCORE - MAX_PLY:
+        return score + ply
+    if score <= MAX_PLY - WIN_SCORE:
+        return score - ply
+    return score
+
+
+def score_from_table(score: int, ply: int) -> int:
+    """
+    Undo `score_to_table` for a position reached at `ply`.
+    """
+    if score >= WIN_SCORE - MAX_PLY:
+        return score - ply
+    if score <= MAX_PLY - WIN_SCORE:
+        return score + ply
+    return score
+
+
+class PVSAgent(MinimaxAgent):
+    """
+    Negamax principal variation search.
+
+    Scores are always from the point of view of the player to move, so both
+    players share one code path. The first move at each node is searched with
+    the full window, and every other move with a null window, only being
+    searched again with the full window if it fails high (i.e. turns out to be
+    better than the first move). With good move ordering the null window
+    searches are much cheaper than full ones.
+
+    The principal variation (the line both players are expected to play) of
+    each completed iteration is kept in `pv`, and is searched first by the
+    next iteration.
+
+    With `ordering_heuristics` set, quiet moves (those that capture nothing)
+    are also ordered by the killer and history heuristics: the last quiet
+    moves to cause a beta cutoff at each ply are tried first, then the rest
+    by how often (weighted by depth) they have caused cutoffs for that
+    player. Both tables persist between iterations, and decay between moves.
+
+    Null window nodes can also be pruned forwards, each with its own flag:
+
+      - `late_move_reductions`: quiet moves late in the move order are first
+        searched to a reduced depth, and only to the full depth if they turn
+        out better than alpha.
+      - `null_move`: if the player to move could pass and still fail high in
+        a reduced search, the node is cut off without searching any moves.
+      - `futility`: one ply from the leaves, quiet moves are skipped if even
+        the most a quiet move can gain (see `futility_margin`) won't raise
+        the static evaluation to alpha.
+    """
+    def __init__(self, color: PlayerColor, *args,
+                 ordering_heuristics: bool=True,
+                 late_move_reductions: bool=True, null_move: bool=True,
+                 futility: bool=True, **kwargs) -> None:
+        super().__init__(color, *args, **kwargs)
+        self.ordering_heuristics: bool = ordering_heuristics
+        self.late_move_reductions: bool = late_move_reductions
+        self.null_move: bool = null_move
+        self.futility: bool = futility
+
+        # killers[ply] holds the quiet moves that last caused a beta cutoff at
+        # `ply`, most recent first, and history[colour][move] the cutoffs
+        # each move has caused for that player.
+        self.killers: list[list[int]] = [[] for _ in range(MAX_PLY + 1)]
+        self.history: list[list[int]] = [[0] * NUM_MOVES for _ in PlayerColor]
+
+        # Statistics: the number of nodes that failed high, and how many of
+        # them did so on the first move searched.
+        self.cutoffs: int = 0
+        self.first_move_cutoffs: int = 0
+
+        # The principal variation of the last completed iteration, as move
+        # ids from the root, and the triangular table that the current
+        # iteration builds it in (_pv_table[ply] is the line from `ply`).
+        self.pv: list[int] = []
+        self._pv_table: list[list[int]] = [[] for _ in range(MAX_PLY + 1)]
+        self._follow_pv: bool = False
+
+    def evaluate(self, b: Board) -> int:
+        """
+        Evaluate the board for the player to move, with the agent's
+        evaluation function.
+        """
+        if self.eval_func == "eval_func1":
+            score = self.evaluate_value(b)
+        else:
+            score = self.evaluate_value2(b)
+        return score if b.turn_color == self._color else -score
+
+    def futility_margin(self) -> int:
+        """
+        The most a quiet move (one that captures nothing) can raise the
+        evaluation by: a SPAWN adds 1 power, and a SPREAD only moves power
+        around, but can add up to MAX_CELL_POWER - 1 cells.
+        """
+        if self.eval_func == "eval_func1":
+            return 1
+        return MAX_CELL_POWER - 1
+
+    def new_turn(self):
+        """
+        Age the killer and history tables before searching a new move. The
+        root has moved on by two plies since the last search, so killers move
+        up two plies, and history scores are halved.
+        """
+        self.killers = self.killers[2:] + [[], []]
+        for history in self.history:
+            for move in range(NUM_MOVES):
+                history[move] >>= 1
+
+    def search(self, b: Board, *args, **kwargs) -> int:
+        self.new_turn()
+        return super().search(b, *args, **kwargs)
+
+    def search_window(self, b: Board, depth: int, alpha: int, beta: int) -> tuple[int, int]:
+        self._follow_pv = True
+        score = self.pvs(b, depth, alpha, beta, 0)
+        # Nothing reaches alpha if the search fails low, so keep following
+        # the old variation.
+        if self._pv_table[0]:
+            self.pv = self._pv_table[0].copy()
+        return self.pv[0], score
+
+    def score_range(self) -> tuple[int, int]:
+        return -INF_SCORE, INF_SCORE
+
+    def is_decisive(self, score: int) -> bool:
+        return abs(score) >= WIN_SCORE - MAX_PLY
+
+    def pvs(self, b: Board, depth: int, alpha: int, beta: int, ply: int,
+            null_ok: bool=True) -> int:
+        """
+        Principal variation search with negamax scoring.
+
+        Args:
+            b (Board): The board to search
+            depth (int): The remaining depth
+            alpha (int): The alpha value, for the player to move
+            beta (int): The beta value, for the player to move
+            ply (int): The distance from the root
+            null_ok (bool): Whether a null move may be tried (not straight
+                after another one)
+
+        Returns:
+            int: The score of the board for the player to move
+        """
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % DEADLINE_CHECK_NODES == 0 \
+                and process_time() > self.deadline:
+            raise SearchTimeout()
+
+        self._pv_table[ply] = []
+        if b.game_over:
+            winner = b.winner_color
+            if winner is None:
+                return 0
+            return WIN_SCORE - ply if winner == b.turn_color else ply - WIN_SCORE
+        if depth == 0 and self.quiescence and ply < MAX_PLY:
+            return self.pvs_quiesce(b, alpha, beta, ply)
+        if depth == 0 or ply >= MAX_PLY:
+            return self.evaluate(b)
+
+        alpha_org = alpha
+        if self.symmetry:
+            b_hash, symmetry = canonical_key(b)
+        else:
+            b_hash, symmetry = b.get_hash(), IDENTITY
+
+        # Probe the transposition table. Scores are only taken from it away
+        # from the principal variation (in null window searches), so that the
+        # variation isn't cut short.
+        tt_score, should_use, tt_move = self.transposition_table.find(
+            b_hash, depth, score_to_table(alpha, ply), score_to_table(beta, ply))
+        if tt_move is not None:
+            tt_move = transform_move(tt_move, SYMMETRY_INVERSE[symmetry])
+        if should_use and ply > 0 and beta - alpha == 1:
+            return score_from_table(tt_score, ply)
+
+        # Search the previous iteration's principal variation first, while
+        # still on it, and otherwise the transposition table's move.
+        first_move = tt_move
+        if self._follow_pv:
+            if ply < len(self.pv):
+                first_move = self.pv[ply]
+            else:
+                self._follow_pv = False
+
+        colour = b.turn_color
+        pv_node = beta - alpha > 1
+        static_score = None
+        if not pv_node and (self.null_move or self.futility):
+            static_score = self.evaluate(b)
+
+        # Null move pruning: pass, and if a reduced search still fails high,
+        # assume some real move would too.
+        if self.null_move and null_ok and not pv_node and ply > 0 \
+                and depth >= NULL_MOVE_MIN_DEPTH and static_score >= beta:
+            b.pass_turn()
+            score = -self.pvs(b, depth - 1 - NULL_MOVE_REDUCTION,
+                              -beta, -beta + 1, ply + 1, False)
+            b.undo_action()
+            if score >= beta:
+                # Passing isn't legal, so don't trust a forced result.
+                return beta if self.is_decisive(score) else score
+
+        futile = self.futility and not pv_node and depth == 1 \
+            and static_score + self.futility_margin() <= alpha
+
+        moves = self.node_moves(b, first_move, ply)
+        best_score = -INF_SCORE
+        best_move = None
+        for i, move in enumerate(moves):
+            quiet = not is_capture_move(b, colour, move)
+            if futile and quiet and i > 0:
+                # A quiet move scores at most the static score plus the
+                # margin, which can't raise alpha, so it is skipped.
+                best_score = max(best_score,
+                                 static_score + self.futility_margin())
+                continue
+
+            b.apply_move(move)
+            if i == 0:
+                score = -self.pvs(b, depth - 1, -beta, -alpha, ply + 1)
+                self._follow_pv = False
+            else:
+                # Null window search to prove the move is no better, with a
+                # full re-search if it is. Late quiet moves are tried at a
+                # reduced depth first.
+                score = alpha + 1
+                if self.late_move_reductions and quiet \
+                        and i >= LMR_MIN_MOVES and depth >= LMR_MIN_DEPTH \
+                        and move not in self.killers[ply]:
+                    score = -self.pvs(b, depth - 1 - LMR_REDUCTION,
+                                      -alpha - 1, -alpha, ply + 1)
+                if score > alpha:
+                    score = -self.pvs(b, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.pvs(b, depth - 1, -beta, -alpha, ply + 1)
+            b.undo_action()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self._pv_table[ply] = [move] + self._pv_table[ply + 1]
+            if alpha >= beta:
+                self.cutoffs += 1
+                if i == 0:
+                    self.first_move_cutoffs += 1
+                if self.ordering_heuristics and quiet:
+                    self.update_heuristics(colour, move, depth, ply)
+                break
+
+        self.transposition_table.store(
+            b_hash, score_to_table(best_score, ply),
+            transform_move(best_move, symmetry), depth,
+            score_to_table(alpha_org, ply), score_to_table(beta, ply))
+
+        return best_score
+
+    def node_moves(self, b: Board, first_move: int | None,
+                   ply: int) -> Iterable[int]:
+        """
+        The moves to search at a node `ply` plies from the root, in the order
+        set by the agent's options, starting with `first_move` if it is legal
+        (and moves are ordered).
+        """
+        colour = b.turn_color
+        if self.move_ordering and self.ordering_heuristics:
+            moves = ordered_moves(b, colour, first_move, phase_spawn_limit(b),
+                                  self.killers[ply], self.history[colour.value])
+        elif self.move_ordering:
+            moves = ordered_moves(b, colour, first_move, phase_spawn_limit(b))
+        else:
+            moves = find_possible_moves(b, colour, phase_spawn_limit(b))
+        if self.dedupe:
+            moves = dedupe_moves(b, moves, self.symmetry)
+        return moves
+
+    def pvs_quiesce(self, b: Board, alpha: int, beta: int, ply: int,
+                    qdepth: int=0) -> int:
+        """
+        Quiescence search with negamax scoring (see `MinimaxAgent.quiesce`).
+
+        Args:
+            b (Board): The board to search
+            alpha (int): The alpha value, for the player to move
+            beta (int): The beta value, for the player to move
+            ply (int): The distance from the root
+            qdepth (int): The number of captures since the leaf
+
+        Returns:
+            int: The score of the board for the player to move
+        """
+        if self.deadline is not None and self.nodes % DEADLINE_CHECK_NODES == 0 \
+                and process_time() > self.deadline:
+            raise SearchTimeout()
+        if b.game_over:
+            winner = b.winner_color
+            if winner is None:
+                return 0
+            return WIN_SCORE - ply if winner == b.turn_color else ply - WIN_SCORE
+
+        stand_pat = self.evaluate(b)
+        if qdepth >= MAX_QUIESCENCE_DEPTH or ply >= MAX_PLY \
+                or stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        best_score = stand_pat
+        opponent_power = b._color_power(b.turn_color.opponent)
+        for gain, move in find_capture_moves(b, b.turn_color):
+            # Delta pruning: the skipped move's best case bounds the score.
+            bound = stand_pat + self.capture_bound(b, move, gain)
+            if bound <= alpha and gain < opponent_power:
+                best_score = max(best_score, bound)
+                continue
+
+            b.apply_move(move)
+            self.nodes += 1
+            score = -self.pvs_quiesce(b, -beta, -alpha, ply + 1, qdepth + 1)
+            b.undo_action()
+
+            if score > best_score:
+                best_score = score
+                alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        return best_score
+
+    def update_heuristics(self, colour: PlayerColor, move: int, depth: int,
+                          ply: int):
+        """
+        Record a quiet move that caused a beta cutoff.
+        """
+        killers = self.killers[ply]
+        if move in killers:
+            killers.remove(move)
+        killers.insert(0, move)
+        del killers[NUM_KILLERS:]
+        self.history[colour.value][move] += depth * depth
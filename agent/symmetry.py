@@ -0,0 +1,146 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+from referee.game.hex import HexDir, HexVec
+from referee.game.player import PlayerColor
+from referee.game.constants import BOARD_N
+
+from .board import Board
+from .moves import NUM_DIRECTIONS, SPAWN_MOVES
+from .tables import CELLS, DIRECTIONS, DIRECTION_INDEX, NUM_CELLS, \
+    ZOBRIST_CELLS, ZOBRIST_TURN, PACKED_POWER_BITS, PACKED_POWER_MASK
+
+# The board is a torus, so every position is strategically equivalent to its
+# BOARD_N * BOARD_N translations. The hex lattice is also preserved by the six
+# rotations and six reflections of a hexagon, and since these are linear maps
+# with determinant +-1 they respect the wrap too. Combined, that gives a group
+# of 12 * 49 symmetries which map any position to an equivalent one.
+#
+# A symmetry is identified by its index into SYMMETRY_CELLS/SYMMETRY_DIRECTIONS
+# (`point * NUM_CELLS + translation`), where SYMMETRY_CELLS[s][i] is the cell
+# index that cell i is mapped to and SYMMETRY_DIRECTIONS[s][d] is the direction
+# index that direction d is mapped to. Index 0 is the identity.
+
+
+def _rotate(r: int, q: int) -> tuple[int, int]:
+    # Rotate by 60 degrees (maps each HexDir to the next one).
+    return -q, r + q
+
+
+def _reflect(r: int, q: int) -> tuple[int, int]:
+    return q, r
+
+
+def _point_maps() -> list:
+    """
+    The twelve symmetries of the hex lattice that fix the origin.
+    """
+    maps = []
+    for reflect in (False, True):
+        for turns in range(6):
+            def point_map(r, q, reflect=reflect, turns=turns):
+                if reflect:
+                    r, q = _reflect(r, q)
+                for _ in range(turns):
+                    r, q = _rotate(r, q)
+                return r, q
+            maps.append(point_map)
+    return maps
+
+
+def _build_symmetries() -> tuple[list, list]:
+    cell_maps, dir_maps = [], []
+    for point_map in _point_maps():
+        dir_map = tuple(
+            DIRECTION_INDEX[HexDir(HexVec(*point_map(d.r, d.q)))]
+            for d in DIRECTIONS
+        )
+        for shift in CELLS:
+            cell_maps.append(tuple(
+                (point_map(c.r, c.q)[0] + shift.r) % BOARD_N * BOARD_N
+                + (point_map(c.r, c.q)[1] + shift.q) % BOARD_N
+                for c in CELLS
+            ))
+            dir_maps.append(dir_map)
+    return cell_maps, dir_maps
+
+
+_cell_maps, _dir_maps = _build_symmetries()
+
+NUM_SYMMETRIES = len(_cell_maps)
+IDENTITY = 0
+
+SYMMETRY_CELLS: tuple[tuple[int, ...], ...] = tuple(_cell_maps)
+SYMMETRY_DIRECTIONS: tuple[tuple[int, ...], ...] = tuple(_dir_maps)
+
+# SYMMETRY_INVERSE[s] undoes symmetry s.
+_symmetry_index = {cells: s for s, cells in enumerate(SYMMETRY_CELLS)}
+SYMMETRY_INVERSE: tuple[int, ...] = tuple(
+    _symmetry_index[tuple(sorted(range(NUM_CELLS), key=cells.__getitem__))]
+    for cells in SYMMETRY_CELLS
+)
+
+
+def _anchored(point: int, idx: int) -> int:
+    r, q = divmod(SYMMETRY_CELLS[point][idx], BOARD_N)
+    return point + (-r % BOARD_N) * BOARD_N + (-q % BOARD_N)
+
+
+# _ANCHORED[p][i] is the symmetry that applies the p-th point symmetry (one
+# fixing cell 0) and then translates the image of cell i onto cell 0.
+_ANCHORED: tuple[tuple[int, ...], ...] = tuple(
+    tuple(_anchored(point, idx) for idx in range(NUM_CELLS))
+    for point in range(0, NUM_SYMMETRIES, NUM_CELLS)
+)
+
+
+def canonical_key(b: Board) -> tuple[int, int]:
+    """
+    Return `(key, symmetry)` for the position on board `b`, where `symmetry`
+    maps `b` onto the canonical member of its equivalence class and `key` is
+    the Zobrist key (including the player to move) of that canonical board.
+    Equivalent positions therefore share the same key.
+
+    The canonical member is the one whose sorted (cell index, packed state)
+    list is lexicographically smallest. Its first cell is always index 0, so
+    only the symmetries that move an occupied cell with the smallest packed
+    state onto cell 0 need to be compared.
+    """
+    turn_key = ZOBRIST_TURN if b.turn_color == PlayerColor.BLUE else 0
+    occupied = b._occupied_cells()
+    if not occupied:
+        return turn_key, IDENTITY
+
+    anchor_state = min(packed for _, packed in occupied)
+    anchors = [idx for idx, packed in occupied if packed == anchor_state]
+
+    best, best_symmetry = None, IDENTITY
+    for anchored in _ANCHORED:
+        for idx in anchors:
+            symmetry = anchored[idx]
+            cells = SYMMETRY_CELLS[symmetry]
+            candidate = sorted((cells[i], packed) for i, packed in occupied)
+            if best is None or candidate < best:
+                best, best_symmetry = candidate, symmetry
+
+    key = turn_key
+    for idx, packed in best:
+        key ^= ZOBRIST_CELLS[idx][packed >> PACKED_POWER_BITS] \
+            [packed & PACKED_POWER_MASK]
+    return key, best_symmetry
+
+
+def transform_move(move: int, symmetry: int) -> int:
+    """
+    Map a move id through a symmetry. To map a move on a canonical board
+    back onto the original board, use `SYMMETRY_INVERSE[symmetry]`.
+    """
+    if symmetry == IDENTITY:
+        return move
+
+    cells = SYMMETRY_CELLS[symmetry]
+    if move >= SPAWN_MOVES:
+        return SPAWN_MOVES + cells[move - SPAWN_MOVES]
+    cell, direction = divmod(move, NUM_DIRECTIONS)
+    return cells[cell] * NUM_DIRECTIONS \
+        + SYMMETRY_DIRECTIONS[symmetry][direction]
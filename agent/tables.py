@@ -0,0 +1,119 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+import random
+
+from referee.game.hex import HexPos, HexDir
+from referee.game.player import PlayerColor
+from referee.game.board import CellState, EMPTY_CELL, CELL_STATES
+from referee.game.constants import BOARD_N, MAX_CELL_POWER, MAX_TURNS
+
+ZOBRIST_SEED = 30024
+
+# Lookup tables computed once at import time, so that the boards and move
+# generators never have to do coordinate arithmetic in the search. Cells are
+# addressed by their index `r * BOARD_N + q` and directions by their position
+# in `HexDir`.
+
+NUM_CELLS = BOARD_N * BOARD_N
+
+# Bitmask with a bit set for every cell index.
+ALL_CELLS_MASK = (1 << NUM_CELLS) - 1
+
+# Every cell on the board, indexed by cell index.
+CELLS: tuple[HexPos, ...] = tuple(
+    HexPos.at(r, q) for r in range(BOARD_N) for q in range(BOARD_N)
+)
+
+# Every direction, and the reverse mapping from direction to index.
+DIRECTIONS: tuple[HexDir, ...] = tuple(HexDir)
+DIRECTION_INDEX: dict[HexDir, int] = {
+    direction: i for i, direction in enumerate(DIRECTIONS)
+}
+
+
+def _spread_ray(cell: HexPos, direction: HexDir) -> tuple[HexPos, ...]:
+    """
+    The cells reached by spreading a maximum power stack from `cell`, in the
+    order they are reached (wrapping around the torus).
+    """
+    return tuple(
+        cell + direction * (i + 1) for i in range(MAX_CELL_POWER)
+    )
+
+
+# SPREAD_RAYS[cell][direction][power] is the tuple of destination cells of a
+# SPREAD from `cell` in `direction` by a stack of the given power, and
+# SPREAD_RAY_INDICES holds the same destinations as cell indices.
+SPREAD_RAYS: tuple[tuple[tuple[tuple[HexPos, ...], ...], ...], ...] = tuple(
+    tuple(
+        tuple(ray[:power] for power in range(MAX_CELL_POWER + 1))
+        for ray in (_spread_ray(cell, direction) for direction in DIRECTIONS)
+    )
+    for cell in CELLS
+)
+
+SPREAD_RAY_INDICES: tuple[tuple[tuple[tuple[int, ...], ...], ...], ...] = tuple(
+    tuple(
+        tuple(
+            tuple(to.r * BOARD_N + to.q for to in ray)
+            for ray in rays
+        )
+        for rays in cell_rays
+    )
+    for cell_rays in SPREAD_RAYS
+)
+
+# SPREAD_RAY_MASKS holds the same destinations again as bitmasks of cell
+# indices, to test a spread against a colour's occupied cells in one step.
+SPREAD_RAY_MASKS: tuple[tuple[tuple[int, ...], ...], ...] = tuple(
+    tuple(
+        tuple(sum(1 << idx for idx in ray) for ray in rays)
+        for rays in cell_rays
+    )
+    for cell_rays in SPREAD_RAY_INDICES
+)
+
+# NEIGHBOUR_MASKS[cell] is the bitmask of the six cells adjacent to `cell`.
+NEIGHBOUR_MASKS: tuple[int, ...] = tuple(
+    sum(1 << rays[direction][1][0] for direction in range(len(DIRECTIONS)))
+    for rays in SPREAD_RAY_INDICES
+)
+
+
+# Zobrist keys used to hash board positions incrementally. A position's key is
+# the XOR of ZOBRIST_CELLS[cell][color][power] over all occupied cells, XORed
+# with ZOBRIST_TURN when BLUE is to move. The generator is seeded so keys are
+# stable across processes and runs.
+_zobrist_rng = random.Random(ZOBRIST_SEED)
+
+ZOBRIST_CELLS: tuple[tuple[tuple[int, ...], ...], ...] = tuple(
+    tuple(
+        (0,) + tuple(
+            _zobrist_rng.getrandbits(64) for _ in range(MAX_CELL_POWER)
+        )
+        for _ in PlayerColor
+    )
+    for _ in CELLS
+)
+
+ZOBRIST_TURN: int = _zobrist_rng.getrandbits(64)
+
+
+# Cell states packed into a small integer, `color << PACKED_POWER_BITS | power`
+# for occupied cells and 0 for empty cells. PACKED_CELL_STATES maps a packed
+# value back to the shared CellState instance.
+PACKED_POWER_BITS = MAX_CELL_POWER.bit_length()
+PACKED_POWER_MASK = (1 << PACKED_POWER_BITS) - 1
+
+PACKED_CELL_STATES: tuple[CellState, ...] = tuple(
+    CELL_STATES[packed >> PACKED_POWER_BITS][packed & PACKED_POWER_MASK]
+    if packed >> PACKED_POWER_BITS < len(PlayerColor) else EMPTY_CELL
+    for packed in range(len(PlayerColor) << PACKED_POWER_BITS)
+)
+
+# An undo journal frame holds a (cell index, previous packed state) pair for
+# each cell changed by an action (at most the source cell and MAX_CELL_POWER
+# destinations), followed by the number of pairs in the frame.
+JOURNAL_FRAME_SIZE = 2 * (MAX_CELL_POWER + 1) + 1
+JOURNAL_SIZE = MAX_TURNS * JOURNAL_FRAME_SIZE
@@ -0,0 +1,156 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+from time import process_time
+
+from referee.game.constants import MAX_TURNS
+from referee.game.player import PlayerColor
+
+from .board import Board
+
+# Number of our own moves a game is expected to last from the start, before
+# adjusting for the material on the board.
+EXPECTED_GAME_MOVES = 60
+
+# Fewest moves the remaining time is ever shared between, so that even late
+# in a game a single move can't use up most of the clock: MIN_MOVES_TO_GO, or
+# 1 / MOVES_LEFT_SHARE of the moves left before the turn limit if more. Games
+# that outlast the expected length can go on to MAX_TURNS.
+MIN_MOVES_TO_GO = 8
+MOVES_LEFT_SHARE = 4
+
+# CPU seconds of the clock reserved for each move we could still have to make
+# before the turn limit, so that the clock can't run out however long the
+# game lasts. Each move gets its own reserve on top of its share of the rest.
+MOVE_RESERVE = 0.02
+
+# The hard budget is this many times the soft budget, but never more than
+# MAX_MOVE_FRACTION of the remaining time.
+HARD_BUDGET_FACTOR = 4.0
+MAX_MOVE_FRACTION = 0.25
+
+# Factor the soft budget grows by each time the best move changes between
+# iterations.
+INSTABILITY_EXTENSION = 1.5
+
+# CPU seconds held back from every move for the work done outside the search
+# (updating the board, the referee's own overheads).
+SAFETY_MARGIN = 0.05
+
+
+# The TimeManager class shares the game clock between the moves of a game.
+# At the start of each move, `start` estimates how many moves are left and
+# sets two deadlines (in `time.process_time` seconds, as measured by the
+# referee's CountdownTimer):
+#
+#   - the soft deadline, after which no new search iteration is started, and
+#   - the hard deadline, at which a search in progress must stop.
+#
+# A search reports each completed iteration to `iteration_done`, which
+# extends the soft deadline (up to the hard one) when the best move changed,
+# and asks `should_stop` before starting the next iteration. Without a time
+# limit both deadlines are None and the search is never stopped.
+
+class TimeManager:
+    __slots__ = [
+        "soft_deadline",
+        "hard_deadline",
+        "_start",
+        "_soft_budget",
+        "_hard_budget",
+        "_best_move",
+    ]
+
+    def __init__(self):
+        self.soft_deadline: float | None = None
+        self.hard_deadline: float | None = None
+        self._start: float = 0.0
+        self._soft_budget: float = 0.0
+        self._hard_budget: float = 0.0
+        self._best_move: int | None = None
+
+    def moves_to_go(self, b: Board) -> int:
+        """
+        Estimate how many more moves we will make in the game on board `b`.
+        Games end early once one player's power runs out, so the estimate
+        shrinks as the power on the board becomes one-sided.
+        """
+        moves_left = self.moves_left(b)
+        red = b._color_power(PlayerColor.RED)
+        blue = b._color_power(PlayerColor.BLUE)
+        balance = min(red, blue) / max(red, blue, 1)
+
+        expected = (EXPECTED_GAME_MOVES - b.turn_count // 2) \
+            * (0.5 + 0.5 * balance)
+        floor = max(MIN_MOVES_TO_GO, moves_left // MOVES_LEFT_SHARE)
+        return max(1, min(moves_left, max(floor, round(expected))))
+
+    def moves_left(self, b: Board) -> int:
+        """
+        The most moves we could still have to make in the game on board `b`
+        (including this one), if it lasts until the turn limit.
+        """
+        return max(1, (MAX_TURNS - b.turn_count + 1) // 2)
+
+    def start(self, b: Board, time_remaining: float | None):
+        """
+        Start timing a move on board `b`, given the CPU time left on the game
+        clock (None if the game has no time limit).
+        """
+        self._start = process_time()
+        self._best_move = None
+        if time_remaining is None:
+            self.soft_deadline = self.hard_deadline = None
+            return
+
+        available = max(time_remaining - SAFETY_MARGIN, 0.0)
+        moves_left = self.moves_left(b)
+        reserve = min(MOVE_RESERVE, available / moves_left)
+        spare = available - reserve * moves_left
+
+        self._soft_budget = spare / self.moves_to_go(b)
+        self._hard_budget = min(self._soft_budget * HARD_BUDGET_FACTOR,
+                                spare * MAX_MOVE_FRACTION)
+        self._soft_budget = reserve + min(self._soft_budget, self._hard_budget)
+        self._hard_budget += reserve
+        self.soft_deadline = self._start + self._soft_budget
+        self.hard_deadline = self._start + self._hard_budget
+
+    def iteration_done(self, best_move: int):
+        """
+        Record the best move of a completed search iteration, extending the
+        soft deadline if it differs from the previous iteration's.
+        """
+        if self.soft_deadline is not None and self._best_move is not None \
+                and best_move != self._best_move:
+            self._soft_budget = min(self._soft_budget * INSTABILITY_EXTENSION,
+                                    self._hard_budget)
+            self.soft_deadline = self._start + self._soft_budget
+        self._best_move = best_move
+
+    def should_stop(self, next_iteration: float=0.0) -> bool:
+        """
+        True iff a search iteration expected to take `next_iteration` CPU
+        seconds would not finish before the soft deadline.
+        """
+        return self.soft_deadline is not None \
+            and process_time() + next_iteration > self.soft_deadline
+
+    def charge(self, seconds: float):
+        """
+        Charge CPU time used outside this process (e.g. by search worker
+        processes) to the move, bringing both deadlines forward. The
+        referee's CountdownTimer only measures this process, so such time
+        must be accounted for here.
+        """
+        self._start -= seconds
+        if self.soft_deadline is not None:
+            self.soft_deadline = self._start + self._soft_budget
+            self.hard_deadline = self._start + self._hard_budget
+
+    @property
+    def elapsed(self) -> float:
+        """
+        CPU seconds used since the move was started.
+        """
+        return process_time() - self._start
@@ -1,66 +1,144 @@
+from array import array
 from enum import Enum
 
-from referee.game.actions import Action
-
 '''
 Constants representing the different flags for a transposition table entry,
 which determine what kind of entry it is. If the entry has a score from
 a fail-low node (alpha wasn't raised), it's an alpha entry. If the entry has
 a score from a fail-high node (a beta cutoff occured), it's a beta entry. And
 if the entry has an exact score (alpha was raised), it's an exact entry.
+Unused slots of the table are flagged as empty.
 '''
 class EntryFlag(Enum):
-    EXACT = 0
-    ALPHA = 1
-    BETA  = 2
+    EMPTY = 0
+    EXACT = 1
+    ALPHA = 2
+    BETA  = 3
+
+'''
+Sizes of the table. Each slot takes ENTRY_BYTES across the columns below. The
+agent's table gets a share of the referee's remaining space, up to
+MAX_TABLE_BYTES, the short-lived agents that play out MCTS rollouts get
+ROLLOUT_TABLE_BYTES, and other tables default to DEFAULT_TABLE_BYTES.
+'''
+ENTRY_BYTES = 8 + 8 + 1 + 1 + 2 + 1
+DEFAULT_TABLE_BYTES = 4 * 2**20
+ROLLOUT_TABLE_BYTES = 64 * 2**10
+MAX_TABLE_BYTES = 64 * 2**20
+TABLE_SPACE_FRACTION = 0.25
+
+# Marks slots whose entry has no best move.
+NO_MOVE = -1
 
-class TableEntry():
-    def __init__(self, best: Action, score: int, flag: EntryFlag, depth: int):
-        self.move: Action = best
-        self.score: int = score
-        self.flag: EntryFlag = flag
-        self.depth = depth
+# Scores are stored as integers. The infinite scores of won and lost positions
+# (from `MinimaxAgent`) are stored as these sentinels, and turned back into
+# infinities when found.
+WIN_SENTINEL = 2**63 - 1
+LOSS_SENTINEL = -WIN_SENTINEL
+
+
+def table_bytes(space_remaining: float | None) -> int:
+    '''
+    Return the size of table to use given the referee's `space_remaining`
+    (in MB, or None if space is unlimited).
+    '''
+    if space_remaining is None:
+        return MAX_TABLE_BYTES
+    return min(int(space_remaining * 2**20 * TABLE_SPACE_FRACTION),
+               MAX_TABLE_BYTES)
+
+
+'''
+A fixed-size transposition table, stored as parallel arrays (one per field)
+so that its memory use is known up front and no objects are allocated per
+entry. Positions hash to a bucket of two slots:
 
+  - slot 0 is depth-preferred: it is only replaced by a search at least as
+    deep, or once its entry is from an older search, and
+  - slot 1 always takes the entry when slot 0 won't.
 
+Each entry records the generation (search number) it was last used in, and
+`new_search` moves on to the next generation, so entries are kept between
+moves but old ones give way to new ones.
+'''
 class Transposition:
-    def __init__(self):
-        self._table: dict[str, TableEntry] = {}
+    __slots__ = [
+        "_num_buckets",
+        "_keys",
+        "_scores",
+        "_depths",
+        "_flags",
+        "_moves",
+        "_generations",
+        "_generation",
+    ]
+
+    def __init__(self, size_bytes: int=DEFAULT_TABLE_BYTES):
+        self._num_buckets = max(size_bytes // (2 * ENTRY_BYTES), 1)
+        num_slots = 2 * self._num_buckets
+        self._keys = array("Q", bytes(8 * num_slots))
+        self._scores = array("q", bytes(8 * num_slots))
+        self._depths = array("b", bytes(num_slots))
+        self._flags = array("b", bytes(num_slots))
+        self._moves = array("h", bytes(2 * num_slots))
+        self._generations = array("B", bytes(num_slots))
+        self._generation = 1
+
+    def new_search(self):
+        # Generations wrap around, skipping 0 so that it never matches.
+        self._generation = self._generation % 255 + 1
 
-    def find(self, hash: str, depth: int, alpha: int, beta: int) -> tuple[int, bool, Action]:
-        if hash not in self._table.keys():
+    def _slot(self, hash: int) -> int:
+        # Return the slot holding `hash`, or -1 if it is not in the table.
+        slot = 2 * (hash % self._num_buckets)
+        for slot in (slot, slot + 1):
+            if self._keys[slot] == hash and self._flags[slot] != EntryFlag.EMPTY.value:
+                return slot
+        return -1
+
+    def find(self, hash: int, depth: int, alpha: int, beta: int) -> tuple[int, bool, int]:
+        slot = self._slot(hash)
+        if slot < 0:
             return 0, False, None
-        
-        entry = self._table[hash]
+
+        # The entry is still in use, so keep it from aging out.
+        self._generations[slot] = self._generation
+
         shouldUse = False
-        best_move = entry.move
-        adjusted_score = entry.score
+        best_move = self._moves[slot]
+        if best_move == NO_MOVE:
+            best_move = None
+        score = self._scores[slot]
+        if score == WIN_SENTINEL:
+            score = float('inf')
+        elif score == LOSS_SENTINEL:
+            score = float('-inf')
+        adjusted_score = score
 
         # To be able to get an accurate value from this entry, the results of 
         # this entry must be from a search that is equal or greater than
         # the current depth of our search.
-        if entry.depth < depth:
+        if self._depths[slot] < depth:
             return adjusted_score, False, best_move
 
-        score = entry.score
-        if entry.flag == EntryFlag.EXACT:
+        flag = self._flags[slot]
+        if flag == EntryFlag.EXACT.value:
             # If we have an exact entry, we can used the saved score
             shouldUse = True
-        elif entry.flag == EntryFlag.ALPHA and score <= alpha:
+        elif flag == EntryFlag.ALPHA.value and score <= alpha:
             # We know that our current alpha is the best score we can get in 
             # this node
             adjusted_score = alpha
             shouldUse = True
-        elif entry.flag == EntryFlag.BETA and score >= beta:
+        elif flag == EntryFlag.BETA.value and score >= beta:
             # While searching this node previously, we found a value greater
             # than the current beta. We have a beta-cutoff.
             adjusted_score = beta
             shouldUse = True
 
-        print(adjusted_score, shouldUse, best_move)
-
         return adjusted_score, shouldUse, best_move
 
-    def store(self, hash: str, score: int, move: Action, depth: int, alpha: int, beta: int):
+    def store(self, hash: int, score: int, move: int, depth: int, alpha: int, beta: int):
         tt_flag = None
 
         if score <= alpha:
@@ -72,8 +150,27 @@ class Transposition:
         else:
             tt_flag = EntryFlag.EXACT
 
-        new_entry = TableEntry(move, score, tt_flag, depth)
-        self._table[hash] = new_entry
+        # Use the depth-preferred slot if it holds this position, is from an
+        # older search or is no deeper than this one, else the other slot.
+        slot = 2 * (hash % self._num_buckets)
+        if self._keys[slot] != hash \
+                and self._generations[slot] == self._generation \
+                and self._depths[slot] > depth:
+            slot += 1
+
+        self._keys[slot] = hash
+        if score == float('inf'):
+            self._scores[slot] = WIN_SENTINEL
+        elif score == float('-inf'):
+            self._scores[slot] = LOSS_SENTINEL
+        else:
+            self._scores[slot] = score
+        self._depths[slot] = depth
+        self._flags[slot] = tt_flag.value
+        self._moves[slot] = NO_MOVE if move is None else move
+        self._generations[slot] = self._generation
 
     def clear(self):
-        self._table = {}
+        num_slots = 2 * self._num_buckets
+        self._flags[:] = array("b", bytes(num_slots))
+        self._generations[:] = array("B", bytes(num_slots))
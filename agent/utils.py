@@ -1,10 +1,237 @@
-from referee.game.actions import Action, SpawnAction, SpreadAction
+from referee.game.actions import Action
 from referee.game.board import Board
-from referee.game.constants import BOARD_N, MAX_TOTAL_POWER
-from referee.game.hex import HexDir, HexPos
+from referee.game.constants import MAX_TOTAL_POWER
 from referee.game.player import PlayerColor
 
-import random
+from .moves import ACTIONS, NUM_DIRECTIONS, SPAWN_MOVES
+from .constants import SPAWN_LIMITS
+from .symmetry import canonical_key
+from .tables import SPREAD_RAY_INDICES, SPREAD_RAY_MASKS, NEIGHBOUR_MASKS
+
+from typing import Iterable, Iterator
+
+
+def mask_indices(mask: int) -> list[int]:
+    """
+    Return the cell indices set in a bitmask, in index order.
+    """
+    indices: list[int] = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+def find_possible_moves(b: Board, c: PlayerColor, spawn_limit: int=3) -> list[int]:
+    """
+    Find the ids (see moves.py) of all the possible SPREAD moves and up to
+    the best `spawn_limit` SPAWN moves for player `c`.
+    """
+    return find_spread_moves(b, c) + find_spawn_moves(b, spawn_limit)
+
+def find_spread_moves(b: Board, color: PlayerColor) -> list[int]:
+    """
+    Find the ids of all the possible SPREAD moves for `color`: one for each
+    of the 6 directions from each of its cells.
+    """
+    move_list: list[int] = []
+
+    for idx in mask_indices(b._color_mask(color)):
+        move = idx * NUM_DIRECTIONS
+        move_list += range(move, move + NUM_DIRECTIONS)
+
+    return move_list
+
+def find_spawn_moves(b: Board, limit: int=3) -> list[int]:
+    """
+    Find the ids of the best `limit` SPAWN moves for the player to move (all
+    of them if `limit` is None), as ranked by `rank_spawn_cells`.
+    """
+    # Check if max power reached
+    if (b._total_power >= MAX_TOTAL_POWER):
+        return []
+
+    return [SPAWN_MOVES + idx for idx in rank_spawn_cells(b, limit)]
+
+def rank_spawn_cells(b: Board, limit: int=None) -> list[int]:
+    """
+    Rank the empty cells as SPAWN targets for the player to move, returning
+    the indices of the best `limit` of them (all of them if `limit` is None).
+
+    Cells that no opponent stack can spread onto next turn come first. Within
+    each group, cells closer to the opponent's stacks come first (to keep up
+    pressure on them), and ties are broken by cell index, so the ranking is
+    deterministic.
+    """
+    empty = b._empty_mask()
+    opponent = b._color_mask(b.turn_color.opponent)
+
+    # Cells reachable by an opponent SPREAD.
+    threatened = 0
+    for idx in mask_indices(opponent):
+        power = b._cell_power(idx)
+        for masks in SPREAD_RAY_MASKS[idx]:
+            threatened |= masks[power]
+
+    # Split the empty cells into layers by distance from the opponent, by
+    # growing the opponent's cells one neighbourhood at a time. Cells that
+    # cannot be reached (no opponent cells) form the last layer.
+    layers: list[int] = []
+    frontier, seen, remaining = opponent, opponent, empty
+    while remaining:
+        grown = 0
+        for idx in mask_indices(frontier):
+            grown |= NEIGHBOUR_MASKS[idx]
+        frontier = grown & ~seen
+        if not frontier:
+            layers.append(remaining)
+            break
+        seen |= frontier
+        layers.append(remaining & frontier)
+        remaining &= ~frontier
+
+    cells: list[int] = []
+    for exposed in (~threatened, threatened):
+        for layer in layers:
+            cells += mask_indices(layer & exposed)
+            if limit is not None and len(cells) >= limit:
+                return cells[:limit]
+    return cells
+
+def dedupe_moves(b: Board, moves: Iterable[int],
+                 symmetry: bool=False) -> Iterator[int]:
+    """
+    Lazily filter `moves`, dropping any move that leads to the same position
+    as an earlier one. Positions are compared by Zobrist key, or with
+    `symmetry` set, by canonical key (see symmetry.py), so that moves leading
+    to symmetric positions are also dropped.
+    """
+    seen: set[int] = set()
+    for move in moves:
+        if symmetry:
+            b.apply_move(move)
+            key = canonical_key(b)[0]
+            b.undo_action()
+        else:
+            key = b.successor_hash(move)
+        if key not in seen:
+            seen.add(key)
+            yield move
+
+def phase_spawn_limit(b: Board) -> int:
+    """
+    The number of SPAWN moves to search in the current game phase (see
+    `SPAWN_LIMITS`).
+    """
+    for end_turn, limit in SPAWN_LIMITS:
+        if end_turn is None or b.turn_count < end_turn:
+            return limit
+
+
+def is_legal_move(b: Board, color: PlayerColor, move: int) -> bool:
+    """
+    Check whether a move id is legal for `color` on board `b`, e.g. for a
+    move taken from the transposition table.
+    """
+    if move >= SPAWN_MOVES:
+        return b._total_power < MAX_TOTAL_POWER \
+            and bool(b._empty_mask() >> (move - SPAWN_MOVES) & 1)
+    return bool(b._color_mask(color) >> (move // NUM_DIRECTIONS) & 1)
+
+def is_capture_move(b: Board, color: PlayerColor, move: int) -> bool:
+    """
+    Check whether a legal move id for `color` is a SPREAD onto at least one
+    opponent cell.
+    """
+    if move >= SPAWN_MOVES:
+        return False
+    idx, direction = divmod(move, NUM_DIRECTIONS)
+    return bool(SPREAD_RAY_MASKS[idx][direction][b._cell_power(idx)]
+                & b._color_mask(color.opponent))
+
+def find_capture_moves(b: Board, color: PlayerColor) -> list[tuple[int, int]]:
+    """
+    Find the SPREAD moves for `color` that capture opponent cells, as
+    (captured power, move id) pairs, most captured power first.
+    """
+    captures: list[tuple[int, int]] = []
+    opponent = b._color_mask(color.opponent)
+    for idx in mask_indices(b._color_mask(color)):
+        power = b._cell_power(idx)
+        rays, masks = SPREAD_RAY_INDICES[idx], SPREAD_RAY_MASKS[idx]
+        for direction in range(NUM_DIRECTIONS):
+            if masks[direction][power] & opponent:
+                gain = sum(
+                    b._cell_power(to_idx)
+                    for to_idx in rays[direction][power]
+                    if opponent >> to_idx & 1
+                )
+                captures.append((gain, idx * NUM_DIRECTIONS + direction))
+    captures.sort(reverse=True)
+    return captures
+
+def ordered_moves(b: Board, color: PlayerColor, tt_move: int|None=None,
+                  spawn_limit: int=3, killers: Iterable[int]=(),
+                  history: list[int]|None=None) -> Iterator[int]:
+    """
+    Lazily generate the moves for `color` in stages, best first for
+    alpha-beta search:
+
+      1. `tt_move` (e.g. the best move from the transposition table), if legal
+      2. SPREAD moves that capture opponent cells, by captured power
+      3. `killers` (quiet moves that caused cutoffs elsewhere), if legal
+      4. the remaining SPREAD moves, by `history` score (indexed by move id)
+         if given
+      5. the best `spawn_limit` SPAWN moves (see `rank_spawn_cells`)
+
+    Each stage is only generated once the previous one is used up, so a
+    cutoff on an early move skips the work of the later stages. The board
+    must be back in its original position whenever the next move is taken.
+    """
+    if tt_move is not None and is_legal_move(b, color, tt_move):
+        yield tt_move
+
+    captures: list[tuple[int, int]] = []
+    quiet: list[int] = []
+    opponent = b._color_mask(color.opponent)
+    for idx in mask_indices(b._color_mask(color)):
+        power = b._cell_power(idx)
+        rays, masks = SPREAD_RAY_INDICES[idx], SPREAD_RAY_MASKS[idx]
+        for direction in range(NUM_DIRECTIONS):
+            move = idx * NUM_DIRECTIONS + direction
+            if move == tt_move:
+                continue
+            if masks[direction][power] & opponent:
+                gain = sum(
+                    b._cell_power(to_idx)
+                    for to_idx in rays[direction][power]
+                    if opponent >> to_idx & 1
+                )
+                captures.append((gain, move))
+            else:
+                quiet.append(move)
+
+    captures.sort(reverse=True)
+    for _, move in captures:
+        yield move
+
+    killer_moves: list[int] = []
+    for move in killers:
+        if move != tt_move and is_legal_move(b, color, move) \
+                and not is_capture_move(b, color, move):
+            killer_moves.append(move)
+            yield move
+
+    if history is not None:
+        quiet.sort(key=history.__getitem__, reverse=True)
+    for move in quiet:
+        if move not in killer_moves:
+            yield move
+
+    for move in find_spawn_moves(b, spawn_limit):
+        if move != tt_move and move not in killer_moves:
+            yield move
 
 
 def find_possible_actions(b: Board, c: PlayerColor, spawn_limit: int=3) -> list[Action]:
@@ -27,32 +254,7 @@ def find_spread_actions(b: Board, color: PlayerColor) -> list[Action]:
     Returns:
     A list of possible actions to take from `coordinate`
     """
-    action_list: list[Action] = []
-
-    for i in range(BOARD_N):
-        for j in range(BOARD_N):
-            if b[HexPos(i, j)].player == color:
-                new_actions = [SpreadAction(
-                    HexPos(i, j), direction) for direction in HexDir]
-                action_list += new_actions
-
-    return action_list
+    return [ACTIONS[move] for move in find_spread_moves(b, color)]
 
 def find_spawn_actions(b, limit=3) -> list[Action]:
-    action_list: list[Action] = []
-    
-    # Check if max power reached
-    if (b._total_power >= MAX_TOTAL_POWER):
-        return action_list
-
-    # Find unoccupied cells
-    for i in range(BOARD_N):
-        for j in range(BOARD_N):
-            if b[HexPos(i, j)].player == None:
-                new_action = SpawnAction(HexPos(i, j))
-                action_list.append(new_action)
-
-    random.shuffle(action_list)
-    if limit == None:
-        return action_list
-    return action_list[0:limit]
\ No newline at end of file
+    return [ACTIONS[move] for move in find_spawn_moves(b, limit)]
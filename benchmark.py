@@ -0,0 +1,430 @@
+"""
+Benchmarks for the agent's search components. Each benchmark plays out a fixed
+set of seeded positions and reports how fast (or how much) the search does.
+
+Usage: `python -m benchmark [name ...]` (runs every benchmark if none given)
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+from agent.board import Board
+from agent.bitboard import BitBoard
+from agent.mcts import MCTSAgent
+from agent.parallel import ParallelAgent
+from agent.minimax import MinimaxAgent
+from agent.pvs import PVSAgent, INF_SCORE
+from agent.timing import TimeManager
+from agent.utils import find_capture_moves
+from agent.utils import find_possible_actions
+from referee.game.player import PlayerColor
+
+NUM_POSITIONS = 8
+PLIES_PER_POSITION = 12
+SEARCH_DEPTH = 3
+MCTS_ITERATIONS = 300
+MOVEGEN_REPEATS = 2000
+NUM_PLAYOUTS = 200
+TACTICS_DEPTH = 4
+CLOCK_SECONDS = 30.0
+
+# Board implementations to compare, by display name.
+BOARDS = {
+    "Board": Board,
+    "Board(journal)": partial(Board, journal=True),
+    "BitBoard": BitBoard,
+}
+
+
+def make_positions(board_cls: type=Board, seed: int=30024) -> list:
+    """
+    Build `NUM_POSITIONS` boards by playing random moves from the empty board,
+    stopping early at the first terminal position.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(NUM_POSITIONS):
+        b = board_cls()
+        for _ in range(rng.randint(4, PLIES_PER_POSITION)):
+            actions = find_possible_actions(b, b.turn_color, None)
+            b.apply_action(rng.choice(actions))
+            if b.game_over:
+                b.undo_action()
+                break
+        positions.append(b)
+    return positions
+
+
+def search_positions(board_cls, depth: int=SEARCH_DEPTH, **options) -> tuple[int, float]:
+    """
+    Run a fixed-depth minimax search on every benchmark position, returning
+    the total number of nodes visited and the CPU time taken. Keyword
+    arguments are passed on to `MinimaxAgent`.
+    """
+    nodes, elapsed = 0, 0.0
+    for b in make_positions(board_cls):
+        agent = MinimaxAgent(b.turn_color, board_cls=board_cls, **options)
+        start = time.process_time()
+        agent.minimax(b, depth, True, float('-inf'), float('inf'))
+        elapsed += time.process_time() - start
+        nodes += agent.nodes
+    return nodes, elapsed
+
+
+def bench_boards():
+    """
+    Compare the node rate of minimax on the dict-backed `Board` against the
+    bitmask-backed `BitBoard`.
+    """
+    for name, board_cls in BOARDS.items():
+        nodes, elapsed = search_positions(board_cls)
+        print(f"{name:>16s}: {nodes:8d} nodes in "
+              f"{elapsed:6.2f}s ({nodes / elapsed:9.0f} nodes/s)")
+
+
+def bench_movegen():
+    """
+    Time move generation (all spreads and spawns) on the benchmark positions.
+    """
+    for name, board_cls in BOARDS.items():
+        positions = make_positions(board_cls)
+        start = time.process_time()
+        for _ in range(MOVEGEN_REPEATS):
+            for b in positions:
+                find_possible_actions(b, b.turn_color, None)
+        elapsed = time.process_time() - start
+        calls = MOVEGEN_REPEATS * len(positions)
+        print(f"{name:>16s}: {elapsed / calls * 1e6:7.2f} us per position")
+
+
+def bench_ordering():
+    """
+    Compare the nodes visited by fixed-depth minimax with moves searched in
+    generation order against the staged move ordering.
+    """
+    for move_ordering in (False, True):
+        nodes, elapsed = search_positions(Board, move_ordering=move_ordering)
+        print(f"move_ordering={move_ordering!s:5s}: {nodes:8d} nodes in "
+              f"{elapsed:6.2f}s")
+
+
+def bench_dedupe():
+    """
+    Compare the nodes visited by fixed-depth minimax with and without
+    dropping moves that lead to identical (or, with symmetry, equivalent)
+    positions.
+    """
+    for symmetry in (False, True):
+        for dedupe in (False, True):
+            nodes, elapsed = search_positions(
+                Board, symmetry=symmetry, dedupe=dedupe)
+            print(f"symmetry={symmetry!s:5s} dedupe={dedupe!s:5s}: "
+                  f"{nodes:8d} nodes in {elapsed:6.2f}s")
+
+
+def search_to_depth(agent_cls, depth: int, **options) -> tuple[int, float]:
+    """
+    Run an iterative deepening search (`agent.search`) to `depth` on every
+    benchmark position, returning the total number of nodes visited and the
+    CPU time taken. Keyword arguments are passed on to the agent.
+    """
+    nodes, elapsed = 0, 0.0
+    for b in make_positions(Board):
+        agent = agent_cls(b.turn_color, **options)
+        start = time.process_time()
+        agent.search(b, max_depth=depth)
+        elapsed += time.process_time() - start
+        nodes += agent.nodes
+    return nodes, elapsed
+
+
+def bench_pvs():
+    """
+    Compare the nodes visited and time taken by iterative deepening to each
+    depth with alpha-beta minimax and with principal variation search.
+    """
+    for depth in range(2, SEARCH_DEPTH + 2):
+        for agent_cls in (MinimaxAgent, PVSAgent):
+            nodes, elapsed = search_to_depth(agent_cls, depth)
+            print(f"depth {depth} {agent_cls.__name__:>12s}: {nodes:8d} "
+                  f"nodes in {elapsed:6.2f}s")
+
+
+def bench_heuristics():
+    """
+    Compare principal variation search with and without the killer and
+    history heuristics, by the nodes visited and the fraction of beta cutoffs
+    that happened on the first move searched.
+    """
+    for ordering_heuristics in (False, True):
+        nodes, cutoffs, first_move_cutoffs, elapsed = 0, 0, 0, 0.0
+        for b in make_positions(Board):
+            agent = PVSAgent(b.turn_color,
+                             ordering_heuristics=ordering_heuristics)
+            start = time.process_time()
+            agent.search(b, max_depth=SEARCH_DEPTH + 1)
+            elapsed += time.process_time() - start
+            nodes += agent.nodes
+            cutoffs += agent.cutoffs
+            first_move_cutoffs += agent.first_move_cutoffs
+        print(f"ordering_heuristics={ordering_heuristics!s:5s}: {nodes:8d} "
+              f"nodes in {elapsed:6.2f}s, "
+              f"{first_move_cutoffs / cutoffs:6.1%} of cutoffs on first move")
+
+
+def bench_quiescence():
+    """
+    Compare principal variation search with and without the quiescence
+    search, by the nodes visited and how much the score swings from one
+    iteration to the next (large swings mean the horizon cuts through
+    exchanges).
+    """
+    for quiescence in (False, True):
+        nodes, swing, iterations, elapsed = 0, 0, 0, 0.0
+        for b in make_positions(Board):
+            agent = PVSAgent(b.turn_color, quiescence=quiescence)
+            start = time.process_time()
+            last_score = None
+            for depth in range(1, SEARCH_DEPTH + 2):
+                _, score = agent.search_depth(b, depth)
+                if last_score is not None:
+                    swing += abs(score - last_score)
+                    iterations += 1
+                last_score = score
+            elapsed += time.process_time() - start
+            nodes += agent.nodes
+        print(f"quiescence={quiescence!s:5s}: {nodes:8d} nodes in "
+              f"{elapsed:6.2f}s, mean score swing {swing / iterations:5.2f}")
+
+
+# Forward pruning options of `PVSAgent` to compare, by display name.
+PRUNING = {
+    "none": {},
+    "lmr": {"late_move_reductions": True},
+    "null move": {"null_move": True},
+    "futility": {"futility": True},
+    "all": {"late_move_reductions": True, "null_move": True, "futility": True},
+}
+
+
+def pruning_agent(color: PlayerColor, **options) -> PVSAgent:
+    """
+    Return a `PVSAgent` with only the given forward pruning options set.
+    """
+    options = {"late_move_reductions": False, "null_move": False,
+               "futility": False, **options}
+    return PVSAgent(color, **options)
+
+
+def tactical_positions() -> list:
+    """
+    The benchmark positions (and more, from another seed) in which the player
+    to move can capture, i.e. in the middle of a fight.
+    """
+    return [b for b in make_positions(Board) + make_positions(Board, seed=1)
+            if find_capture_moves(b, b.turn_color)]
+
+
+def bench_pruning():
+    """
+    Check each forward pruning option against a tactical suite, counting the
+    positions where the move found at TACTICS_DEPTH is worse than the best
+    move found without pruning, and compare the depth each reaches with
+    CLOCK_SECONDS left on the clock.
+    """
+    positions = tactical_positions()
+    best_scores = [pruning_agent(b.turn_color).search_depth(b, TACTICS_DEPTH)[1]
+                   for b in positions]
+    baseline = None
+
+    for name, options in PRUNING.items():
+        failed = []
+        for i, (b, best_score) in enumerate(zip(positions, best_scores)):
+            move = pruning_agent(b.turn_color, **options) \
+                .search(b, max_depth=TACTICS_DEPTH)
+            b.apply_move(move)
+            score = -pruning_agent(b.turn_color).pvs(
+                b, TACTICS_DEPTH - 1, -INF_SCORE, INF_SCORE, 1)
+            b.undo_action()
+            if score < best_score:
+                failed.append(i)
+
+        depth, nodes, elapsed = 0, 0, 0.0
+        timer = TimeManager()
+        for b in make_positions(Board):
+            agent = pruning_agent(b.turn_color, **options)
+            start = time.process_time()
+            timer.start(b, CLOCK_SECONDS)
+            agent.search(b, timer)
+            elapsed += time.process_time() - start
+            depth += agent.completed_depth
+            nodes += agent.nodes
+        depth /= NUM_POSITIONS
+        if baseline is None:
+            baseline = depth
+
+        print(f"{name:>10s}: {len(positions) - len(failed):2d}/"
+              f"{len(positions)} tactics, mean depth {depth:4.2f} "
+              f"({depth - baseline:+4.2f}), {nodes / elapsed:6.0f} nodes/s"
+              + (f", failed {failed}" if failed else ""))
+
+
+def bench_aspiration():
+    """
+    Compare the nodes visited by iterative deepening with and without
+    aspiration windows, and how often the window had to be widened.
+    """
+    for agent_cls in (MinimaxAgent, PVSAgent):
+        for aspiration in (False, True):
+            nodes, researches, elapsed = 0, 0, 0.0
+            for b in make_positions(Board):
+                agent = agent_cls(b.turn_color, aspiration=aspiration)
+                start = time.process_time()
+                agent.search(b, max_depth=SEARCH_DEPTH + 2)
+                elapsed += time.process_time() - start
+                nodes += agent.nodes
+                researches += agent.researches
+            print(f"{agent_cls.__name__:>12s} aspiration={aspiration!s:5s}: "
+                  f"{nodes:8d} nodes in {elapsed:6.2f}s, "
+                  f"{researches:3d} re-searches")
+
+
+def bench_parallel():
+    """
+    Compare iterative deepening to a fixed depth in one process against the
+    root split across a pool of workers (one per CPU), by wall-clock time and
+    by the total CPU time used, including the workers'.
+    """
+    for num_workers in (0, os.cpu_count()):
+        agents = {color: ParallelAgent(color, num_workers=num_workers)
+                  for color in PlayerColor}
+        nodes, cpu, wall = 0, 0.0, 0.0
+        for b in make_positions(Board):
+            agent = agents[b.turn_color]
+            agent.nodes = 0
+            worker_time = agent.worker_time
+            start, wall_start = time.process_time(), time.perf_counter()
+            agent.search(b, max_depth=SEARCH_DEPTH + 2)
+            cpu += time.process_time() - start + agent.worker_time - worker_time
+            wall += time.perf_counter() - wall_start
+            nodes += agent.nodes
+        for agent in agents.values():
+            agent.close()
+        print(f"num_workers={num_workers:2d}: {nodes:8d} nodes in "
+              f"{wall:6.2f}s wall, {cpu:6.2f}s CPU")
+
+
+def random_line(seed: int=30024, max_plies: int=100) -> list:
+    """
+    Return the actions of a seeded random game, cut off at `max_plies`.
+    """
+    rng = random.Random(seed)
+    b, line = Board(), []
+    while not b.game_over and len(line) < max_plies:
+        action = rng.choice(find_possible_actions(b, b.turn_color, None))
+        b.apply_action(action)
+        line.append(action)
+    return line
+
+
+def bench_memory():
+    """
+    Compare the memory used to record undo information: the memory held by
+    the undo history while a long line of play is on the board, and the peak
+    traced memory of a fixed-depth search.
+    """
+    line = random_line()
+    for name, board_cls in BOARDS.items():
+        b = board_cls()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for action in line:
+            b.apply_action(action)
+        history = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        peak = 0
+        for b in make_positions(board_cls):
+            agent = MinimaxAgent(b.turn_color, board_cls=board_cls)
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            agent.minimax(b, SEARCH_DEPTH, True, float('-inf'), float('inf'))
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+            tracemalloc.stop()
+
+        print(f"{name:>16s}: {history / len(line):7.1f} B of undo history "
+              f"per ply, search peak {peak / 1024:6.1f} KiB")
+
+
+def bench_symmetry():
+    """
+    Compare minimax and MCTS with and without keying positions by their
+    canonical form under the torus symmetries.
+    """
+    for symmetry in (False, True):
+        nodes, elapsed = search_positions(Board, symmetry=symmetry)
+        print(f"minimax symmetry={symmetry!s:5s}: {nodes:8d} nodes in "
+              f"{elapsed:6.2f}s")
+
+    for symmetry in (False, True):
+        random.seed(0)
+        agent = MCTSAgent({}, Board, symmetry)
+        start = time.process_time()
+        agent.mcts(MCTS_ITERATIONS, b=Board())
+        elapsed = time.process_time() - start
+        print(f"   mcts symmetry={symmetry!s:5s}: {len(agent.tree):8d} tree "
+              f"nodes in {elapsed:6.2f}s")
+
+
+def bench_playouts():
+    """
+    Compare the rate of uniformly random playouts from the empty board, one
+    `Board` at a time against a whole `BatchBoard` at once.
+    """
+    # NumPy is an optional dependency, only needed for this benchmark.
+    import numpy as np
+    from agent.batch import BatchBoard, random_playouts
+
+    rng = random.Random(30024)
+    start = time.process_time()
+    for _ in range(NUM_PLAYOUTS):
+        b = Board()
+        while not b.game_over:
+            b.apply_trusted(rng.choice(
+                find_possible_actions(b, b.turn_color, None)))
+    elapsed = time.process_time() - start
+    print(f"{'Board':>16s}: {NUM_PLAYOUTS:8d} playouts in "
+          f"{elapsed:6.2f}s ({NUM_PLAYOUTS / elapsed:9.1f} playouts/s)")
+
+    start = time.process_time()
+    random_playouts(BatchBoard(NUM_PLAYOUTS), np.random.default_rng(30024))
+    elapsed = time.process_time() - start
+    print(f"{'BatchBoard':>16s}: {NUM_PLAYOUTS:8d} playouts in "
+          f"{elapsed:6.2f}s ({NUM_PLAYOUTS / elapsed:9.1f} playouts/s)")
+
+
+BENCHMARKS = {
+    "boards": bench_boards,
+    "movegen": bench_movegen,
+    "ordering": bench_ordering,
+    "dedupe": bench_dedupe,
+    "pvs": bench_pvs,
+    "heuristics": bench_heuristics,
+    "quiescence": bench_quiescence,
+    "pruning": bench_pruning,
+    "aspiration": bench_aspiration,
+    "parallel": bench_parallel,
+    "memory": bench_memory,
+    "symmetry": bench_symmetry,
+    "playouts": bench_playouts,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -31,6 +31,29 @@ class CellState:
         yield self.player
         yield self.power
 
+    def __reduce__(self):
+        # Unpickle to the shared instance.
+        return _cell_state, (self.player, self.power)
+
+
+# There are only 1 + 2 * MAX_CELL_POWER distinct cell states, so shared
+# instances are pre-built: EMPTY_CELL, and CELL_STATES[color][power] for each
+# player colour. Index MAX_CELL_POWER + 1 is included (as EMPTY_CELL) for
+# stacks that overflow when spread onto.
+
+EMPTY_CELL = CellState()
+
+CELL_STATES: tuple[tuple[CellState, ...], ...] = tuple(
+    (EMPTY_CELL,)
+    + tuple(CellState(color, power) for power in range(1, MAX_CELL_POWER + 1))
+    + (EMPTY_CELL,)
+    for color in PlayerColor
+)
+
+
+def _cell_state(player: PlayerColor|None, power: int) -> CellState:
+    return EMPTY_CELL if player is None else CELL_STATES[player.value][power]
+
 
 @dataclass(frozen=True, slots=True)
 class CellMutation:
@@ -69,16 +92,24 @@ class Board:
         "_mutable", 
         "_state", 
         "_turn_color", 
-        "_history"
+        "_history",
+        "_color_powers",
+        "_color_cells",
     ]
 
     def __init__(self, initial_state: dict[HexPos, CellState]={}):
         self._state: dict[HexPos, CellState] = \
-            defaultdict(lambda: CellState(None, 0))
-        self._state.update(initial_state)
+            defaultdict(lambda: EMPTY_CELL)
         self._turn_color: PlayerColor = PlayerColor.RED
         self._history: list[BoardMutation] = []
 
+        # Running totals of power and occupied cells, indexed by PlayerColor
+        # and kept in sync by `_set_cell`.
+        self._color_powers: list[int] = [0, 0]
+        self._color_cells: list[int] = [0, 0]
+        for cell, state in initial_state.items():
+            self._set_cell(cell, state)
+
     def __getitem__(self, cell: HexPos) -> CellState:
         """
         Return the state of a cell on the board.
@@ -102,7 +133,7 @@ class Board:
                     f"Unknown action {action}", self._turn_color)
 
         for mutation in res_action.cell_mutations:
-            self._state[mutation.cell] = mutation.next
+            self._set_cell(mutation.cell, mutation.next)
 
         self._history.append(res_action)
         self._turn_color = self._turn_color.opponent
@@ -117,7 +148,7 @@ class Board:
 
         action: BoardMutation = self._history.pop()
         for mutation in action.cell_mutations:
-            self._state[mutation.cell] = mutation.prev
+            self._set_cell(mutation.cell, mutation.prev)
         self._turn_color = self._turn_color.opponent
 
     def render(self, use_color: bool=False, use_unicode: bool=False) -> str:
@@ -144,8 +175,8 @@ class Board:
                 # Map row, col to r, q
                 r = max((dim - 1) - row, 0) + col
                 q = max(row - (dim - 1), 0) + col
-                if self._cell_occupied(HexPos(r, q)):
-                    color, power = self._state[HexPos(r, q)]
+                if self._cell_occupied(HexPos.at(r, q)):
+                    color, power = self._state[HexPos.at(r, q)]
                     color = "r" if color == PlayerColor.RED else "b"
                     text = f"{color}{power}".center(4)
                     if use_color:
@@ -180,11 +211,9 @@ class Board:
         if self.turn_count < 2: 
             return False
         
-        return any([
-            self.turn_count >= MAX_TURNS,
-            self._color_power(PlayerColor.RED) == 0,
-            self._color_power(PlayerColor.BLUE) == 0
-        ])
+        return self.turn_count >= MAX_TURNS \
+            or self._color_powers[PlayerColor.RED.value] == 0 \
+            or self._color_powers[PlayerColor.BLUE.value] == 0
     
     @property
     def winner_color(self) -> PlayerColor | None:
@@ -207,7 +236,7 @@ class Board:
         """
         The total power of all cells on the board.
         """
-        return sum(map(lambda cell: cell.power, self._state.values()))
+        return self._color_powers[0] + self._color_powers[1]
     
     def _player_cells(self, color: PlayerColor) -> list[CellState]:
         return list(filter(
@@ -216,11 +245,27 @@ class Board:
         ))
 
     def _color_power(self, color: PlayerColor) -> int:
-        return sum(map(lambda cell: cell.power, self._player_cells(color)))
+        return self._color_powers[color.value]
+
+    def _color_cell_count(self, color: PlayerColor) -> int:
+        return self._color_cells[color.value]
+
+    def _set_cell(self, cell: HexPos, state: CellState):
+        """
+        Overwrite the state of a cell, keeping the power and cell counters up
+        to date.
+        """
+        prev = self._state[cell]
+        if prev.player is not None:
+            self._color_powers[prev.player.value] -= prev.power
+            self._color_cells[prev.player.value] -= 1
+        if state.player is not None:
+            self._color_powers[state.player.value] += state.power
+            self._color_cells[state.player.value] += 1
+        self._state[cell] = state
     
     def _within_bounds(self, coord: HexPos) -> bool:
-        r, q = coord
-        return 0 <= r < BOARD_N and 0 <= q < BOARD_N
+        return 0 <= coord.r < BOARD_N and 0 <= coord.q < BOARD_N
     
     def _cell_occupied(self, coord: HexPos) -> bool:
         return self._state[coord].power > 0
@@ -267,7 +312,7 @@ class Board:
         return BoardMutation(
             action,
             cell_mutations={CellMutation(cell, self._state[cell], 
-                                         CellState(self._turn_color, 1)
+                                         CELL_STATES[self._turn_color.value][1]
             )},
         )
 
@@ -291,11 +336,11 @@ class Board:
             action,
             cell_mutations={
                 # Remove token stack from source cell.
-                CellMutation(from_cell, self[from_cell], CellState()),
+                CellMutation(from_cell, self[from_cell], EMPTY_CELL),
             } | {
                 # Add token stack to destination cells.
                 CellMutation(to_cell, self[to_cell], 
-                    CellState(action_player, self[to_cell].power + 1)
+                    CELL_STATES[action_player.value][self[to_cell].power + 1]
                 ) for to_cell in to_cells
             }
         )
@@ -53,6 +53,12 @@ class HexDir(Enum):
     Up        = HexVec(1, -1)
     UpRight   = HexVec(1, 0)
 
+    def __init__(self, value: HexVec):
+        # Cache the components on the member itself, so that `.r`/`.q` are
+        # plain attribute lookups.
+        self.r: int = value.r
+        self.q: int = value.q
+
     @classmethod
     def _missing_(cls, value: tuple[int, int]):
         for item in cls:
@@ -76,23 +82,18 @@ class HexDir(Enum):
             HexDir.UpRight:   "[↗]"
         }[self]
 
-    def __getattribute__(self, __name: str) -> int:
-        match __name:
-            case "r":
-                return self.value.r
-            case "q":
-                return self.value.q
-            case _:
-                return super().__getattribute__(__name)
-
 
 # HexPos represents a position in the axial coordinate system used by the game.
 # Similar to HexDir, it's used to represent the position of a cell on the board
 # in Action dataclasses (see actions.py). For convenience and safety, it also
 # ensures computed vector additions/subtractions are within the bounds of the
 # board, and throws an exception if trying to create an out-of-bounds position.
+#
+# There are only BOARD_N * BOARD_N valid positions, so a pre-built instance of
+# each is kept in a table. `HexPos.at(r, q)` returns these shared instances
+# without re-validating them, and vector arithmetic on positions uses them too.
 
-@dataclass(order=True, frozen=True)
+@dataclass(order=True, frozen=True, slots=True)
 class HexPos(HexVec):
 
     def __post_init__(self):
@@ -102,14 +103,30 @@ class HexPos(HexVec):
     def __str__(self):
         return f"{self.r}-{self.q}"
 
+    @staticmethod
+    def at(r: int, q: int) -> 'HexPos':
+        """
+        Return the shared instance of the (in-bounds) position `(r, q)`.
+        """
+        return _HEX_POSITIONS[r * BOARD_N + q]
+
+    def __reduce__(self):
+        # Unpickle to the shared instance.
+        return HexPos.at, (self.r, self.q)
+
     def __add__(self, other: 'HexDir|HexVec') -> 'HexPos':
-        return self.__class__(
-            (self.r + other.r) % BOARD_N, 
-            (self.q + other.q) % BOARD_N,
-        )
+        return _HEX_POSITIONS[
+            (self.r + other.r) % BOARD_N * BOARD_N
+            + (self.q + other.q) % BOARD_N
+        ]
 
     def __sub__(self, other: 'HexDir|HexVec') -> 'HexPos':
-        return self.__class__(
-            (self.r - other.r) % BOARD_N, 
-            (self.q - other.q) % BOARD_N
-        )
+        return _HEX_POSITIONS[
+            (self.r - other.r) % BOARD_N * BOARD_N
+            + (self.q - other.q) % BOARD_N
+        ]
+
+
+_HEX_POSITIONS: tuple[HexPos, ...] = tuple(
+    HexPos(r, q) for r in range(BOARD_N) for q in range(BOARD_N)
+)